@@ -11,3 +11,9 @@ class FILE_EXT(Enum):
     COMPILABLE = "lcom"
     ASSEMBLY = "lasm"
     BYTECODE = "lbin"
+
+
+# Version of the compiler, assembler and instruction set. Bump it whenever
+# a change alters the bytecode built from a given source, so that cached
+# builds are not reused.
+TOOLCHAIN_VERSION = 12
@@ -34,6 +34,8 @@ class INSTR(enum.IntEnum):
     SEND = 0x08
     STACK = 0x0A
     SWAP = 0x0C
+    MEMSET = 0x0E
+    MEMCPY = 0x0F
 
     JMP = 0x10
     JMPC = 0x11
@@ -51,6 +53,10 @@ class INSTR(enum.IntEnum):
     SUBC = 0x23
     MUL = 0x24
     MULC = 0x26
+    DIV = 0x28
+    DIVC = 0x29
+    MOD = 0x2A
+    MODC = 0x2B
 
     INC = 0x30
     DEC = 0x31
@@ -65,10 +71,52 @@ class INSTR(enum.IntEnum):
     OUTC = 0x49
 
 
-def masm_to_bytecode(file: TextIO):
+# Number of operand bytes following the opcode of each instruction.
+INSTR_OPERANDS = {
+    INSTR.NOP: 0,
+    INSTR.END: 0,
+    INSTR.SET: 2,
+    INSTR.MOV: 2,
+    INSTR.SEND: 2,
+    INSTR.STACK: 1,
+    INSTR.SWAP: 2,
+    INSTR.MEMSET: 3,
+    INSTR.MEMCPY: 3,
+    INSTR.JMP: 1,
+    INSTR.JMPC: 1,
+    INSTR.JZ: 2,
+    INSTR.JNZ: 2,
+    INSTR.JPOS: 2,
+    INSTR.JNEG: 2,
+    INSTR.JCARRY: 1,
+    INSTR.JNCARRY: 1,
+    INSTR.ADD: 2,
+    INSTR.ADDC: 2,
+    INSTR.SUB: 2,
+    INSTR.SUBC: 2,
+    INSTR.MUL: 2,
+    INSTR.MULC: 2,
+    INSTR.DIV: 2,
+    INSTR.DIVC: 2,
+    INSTR.MOD: 2,
+    INSTR.MODC: 2,
+    INSTR.INC: 1,
+    INSTR.DEC: 1,
+    INSTR.IN: 1,
+    INSTR.OUT: 1,
+    INSTR.OUTC: 1,
+}
+
+
+def masm_to_bytecode(file: TextIO, source_map: list[int] | None = None):
+    """
+    Assembles the .lasm file into a 256-byte image. If <source_map> is
+    given, the (1-based) line number every byte of code was assembled from
+    is appended to it, starting with the first byte after the header.
+    """
     macros = {char: index for index, char in enumerate(ascii_uppercase)}
     bytecode = bytearray([0x00] * LOCATION.HEADER_END)
-    for line in file:
+    for line_number, line in enumerate(file, 1):
         for word in line.split():
             macros["LEN"] = len(bytecode)
 
@@ -100,6 +148,8 @@ def masm_to_bytecode(file: TextIO):
 
             # Adding instruction to bytecode
             bytecode.append(int(word) % 256)
+            if source_map is not None:
+                source_map.append(line_number)
 
     bytecode[LOCATION.INSTR_PTR] = macros["MAIN"]
     bytecode[LOCATION.STACK_PTR] = len(bytecode) // 16 * 16 + 16
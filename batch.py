@@ -0,0 +1,275 @@
+# batch.py
+
+import numpy as np
+
+from assembler import LOCATION, INSTR, INSTR_OPERANDS
+from interpreter import cycle
+
+# Operand addresses (and jump targets) below this bound touch the header
+# bytes; lanes executing such instructions are stepped with cycle().
+_SPECIAL_END = LOCATION.OUTPUT + 1
+
+_CONDITIONAL_JUMPS = (INSTR.JZ, INSTR.JNZ, INSTR.JPOS, INSTR.JNEG)
+_JUMPS = (INSTR.JMP, INSTR.JMPC, INSTR.JCARRY, INSTR.JNCARRY) + _CONDITIONAL_JUMPS
+
+# Per-opcode lookup tables, indexed by the opcode byte of each lane.
+_SIZE = np.zeros(256, dtype=np.intp)
+_KNOWN = np.zeros(256, dtype=bool)
+# Whether the first/second operand is a (stack relative) address
+_REL1 = np.zeros(256, dtype=bool)
+_REL2 = np.zeros(256, dtype=bool)
+
+for _instr, _operands in INSTR_OPERANDS.items():
+    _SIZE[_instr] = 1 + _operands
+    _KNOWN[_instr] = True
+
+for _instr in (
+    INSTR.SET,
+    INSTR.MOV,
+    INSTR.SEND,
+    INSTR.SWAP,
+    INSTR.JMP,
+    INSTR.JZ,
+    INSTR.JNZ,
+    INSTR.JPOS,
+    INSTR.JNEG,
+    INSTR.ADD,
+    INSTR.ADDC,
+    INSTR.SUB,
+    INSTR.SUBC,
+    INSTR.MUL,
+    INSTR.MULC,
+    INSTR.DIV,
+    INSTR.DIVC,
+    INSTR.MOD,
+    INSTR.MODC,
+    INSTR.INC,
+    INSTR.DEC,
+    INSTR.IN,
+    INSTR.OUT,
+):
+    _REL1[_instr] = True
+
+for _instr in (
+    INSTR.MOV,
+    INSTR.SEND,
+    INSTR.SWAP,
+    INSTR.ADD,
+    INSTR.SUB,
+    INSTR.MUL,
+    INSTR.DIV,
+    INSTR.MOD,
+):
+    _REL2[_instr] = True
+
+# STACK changes the stack pointer, which lives in the header. MEMSET and
+# MEMCPY touch a run of bytes whose length differs from lane to lane.
+_KNOWN[INSTR.STACK] = False
+_KNOWN[INSTR.MEMSET] = False
+_KNOWN[INSTR.MEMCPY] = False
+
+
+def batch_states(state: bytearray, count: int) -> np.ndarray:
+    """
+    Returns a (count, 256) array holding <count> copies of <state>.
+    """
+    return np.tile(np.frombuffer(bytes(state), dtype=np.uint8), (count, 1))
+
+
+def _tick_clocks(states: np.ndarray, lanes: np.ndarray):
+    """
+    Increments the 4-byte clock of every given lane, wrapping around.
+    """
+    clock_bytes = states[lanes, LOCATION.CLOCK_START : LOCATION.CLOCK_END + 1]
+    clock = np.zeros(len(lanes), dtype=np.uint32)
+    for index in range(4):
+        clock = (clock << 8) | clock_bytes[:, index]
+
+    clock += np.uint32(1)
+    for index in reversed(range(4)):
+        clock_bytes[:, index] = clock & 0xFF
+        clock >>= 8
+
+    states[lanes, LOCATION.CLOCK_START : LOCATION.CLOCK_END + 1] = clock_bytes
+
+
+def _step_slow(states: np.ndarray, lanes: np.ndarray):
+    """
+    Steps the given lanes one at a time with cycle().
+    """
+    for lane in lanes:
+        state = bytearray(states[lane].tobytes())
+        cycle(state)
+        states[lane] = np.frombuffer(state, dtype=np.uint8)
+
+
+def step_batch(states: np.ndarray, lanes: np.ndarray):
+    """
+    Executes one instruction on each of the given lanes of <states>, an
+    (N, 256) uint8 array of machine states. Every lane ends up exactly as
+    if cycle() had been called on it.
+
+    Lanes are grouped by their current opcode and each group is executed
+    with vectorized array operations.
+    """
+    ip = states[lanes, LOCATION.INSTR_PTR].astype(np.intp)
+    sp = states[lanes, LOCATION.STACK_PTR].astype(np.intp)
+    instr = states[lanes, ip]
+
+    operand1 = states[lanes, (ip + 1) % 256].astype(np.intp)
+    operand2 = states[lanes, (ip + 2) % 256].astype(np.intp)
+    rel1 = (operand1 + sp) % 256
+    rel2 = (operand2 + sp) % 256
+
+    # Find the lanes that have to be stepped by cycle(): unknown opcodes,
+    # code running in (or past the end of) memory, and instructions
+    # touching the header bytes.
+    slow = ~_KNOWN[instr] | (ip < _SPECIAL_END) | (ip + _SIZE[instr] > 0xFF)
+    slow |= _REL1[instr] & (rel1 < _SPECIAL_END)
+    slow |= _REL2[instr] & (rel2 < _SPECIAL_END)
+
+    send = instr == INSTR.SEND
+    send_dest = (rel1 + states[lanes, rel2]) % 256
+    slow |= send & (send_dest < _SPECIAL_END)
+
+    target = np.where(instr == INSTR.JMP, states[lanes, rel1], operand1)
+    target = np.where(np.isin(instr, _CONDITIONAL_JUMPS), operand2, target)
+    slow |= np.isin(instr, _JUMPS) & (target < _SPECIAL_END)
+
+    _step_slow(states, lanes[slow])
+
+    fast = ~slow
+    lanes, ip, instr = lanes[fast], ip[fast], instr[fast]
+    operand1, operand2 = operand1[fast], operand2[fast]
+    rel1, rel2 = rel1[fast], rel2[fast]
+    send_dest, target = send_dest[fast], target[fast]
+
+    _tick_clocks(states, lanes)
+    states[lanes, LOCATION.OUTPUT] = 0
+
+    next_ip = ip + _SIZE[instr]
+
+    for opcode in np.unique(instr):
+        group = instr == opcode
+        lane = lanes[group]
+        dest, src = rel1[group], rel2[group]
+
+        match opcode:
+            case INSTR.END:
+                next_ip[group] = ip[group]
+
+            case INSTR.SET:
+                states[lane, dest] = operand2[group]
+
+            case INSTR.MOV:
+                states[lane, dest] = states[lane, src]
+
+            case INSTR.SEND:
+                states[lane, send_dest[group]] = states[lane, dest]
+
+            case INSTR.SWAP:
+                values = states[lane, dest], states[lane, src]
+                states[lane, src] = values[0]
+                states[lane, dest] = values[1]
+
+            case (INSTR.JMP | INSTR.JMPC):
+                next_ip[group] = target[group]
+
+            case (INSTR.JZ | INSTR.JNZ | INSTR.JPOS | INSTR.JNEG):
+                value = states[lane, dest]
+                if opcode == INSTR.JZ:
+                    taken = value == 0
+                elif opcode == INSTR.JNZ:
+                    taken = value != 0
+                elif opcode == INSTR.JPOS:
+                    taken = (value >= 0x01) & (value < 0x7F)
+                else:
+                    taken = (value >= 0x80) & (value < 0xFF)
+                next_ip[group] = np.where(taken, target[group], next_ip[group])
+
+            case (INSTR.JCARRY | INSTR.JNCARRY):
+                taken = states[lane, LOCATION.FLAG_CARRY] != 0
+                if opcode == INSTR.JNCARRY:
+                    taken = ~taken
+                next_ip[group] = np.where(taken, target[group], next_ip[group])
+
+            case (
+                INSTR.ADD | INSTR.ADDC | INSTR.SUB | INSTR.SUBC | INSTR.INC | INSTR.DEC
+            ):
+                if opcode in (INSTR.ADD, INSTR.SUB):
+                    value = states[lane, src].astype(np.intp)
+                elif opcode in (INSTR.ADDC, INSTR.SUBC):
+                    value = operand2[group]
+                else:
+                    value = np.ones(len(lane), dtype=np.intp)
+
+                if opcode in (INSTR.SUB, INSTR.SUBC, INSTR.DEC):
+                    value = -value
+
+                res = states[lane, dest].astype(np.intp) + value
+                states[lane, LOCATION.FLAG_CARRY] = (res < 0) | (res > 0xFF)
+                states[lane, dest] = res % 256
+
+            case (INSTR.MUL | INSTR.MULC):
+                if opcode == INSTR.MUL:
+                    value = states[lane, src].astype(np.intp)
+                else:
+                    value = operand2[group]
+                res = states[lane, dest].astype(np.intp) * value
+                states[lane, dest] = res % 256
+
+            case (INSTR.DIV | INSTR.DIVC | INSTR.MOD | INSTR.MODC):
+                if opcode in (INSTR.DIV, INSTR.MOD):
+                    value = states[lane, src].astype(np.intp)
+                else:
+                    value = operand2[group]
+                # Dividing by zero leaves the destination unchanged
+                zero = value == 0
+                value = np.where(zero, 1, value)
+                dividend = states[lane, dest].astype(np.intp)
+                if opcode in (INSTR.DIV, INSTR.DIVC):
+                    res = dividend // value
+                else:
+                    res = np.where(zero, dividend, dividend % value)
+                states[lane, LOCATION.FLAG_CARRY] = zero
+                states[lane, dest] = res
+
+            case INSTR.IN:
+                states[lane, dest] = states[lane, LOCATION.INPUT]
+
+            case INSTR.OUT:
+                states[lane, LOCATION.OUTPUT] = states[lane, dest]
+
+            case INSTR.OUTC:
+                states[lane, LOCATION.OUTPUT] = operand1[group]
+
+    states[lanes, LOCATION.INSTR_PTR] = next_ip
+
+
+def run_batch(
+    states: np.ndarray, max_cycles: int, until_end: bool = True
+) -> np.ndarray:
+    """
+    Executes up to <max_cycles> instructions on every lane of <states>, an
+    (N, 256) uint8 array of machine states, in lockstep. Returns the number
+    of instructions executed by each lane.
+
+    If <until_end> is set, a lane stops (without executing it) once its
+    instruction pointer reaches an END instruction, and is masked out of
+    the remaining steps.
+    """
+    all_lanes = np.arange(len(states))
+    executed = np.zeros(len(states), dtype=np.int64)
+
+    for _ in range(max_cycles):
+        lanes = all_lanes
+        if until_end:
+            ip = states[:, LOCATION.INSTR_PTR]
+            lanes = all_lanes[states[all_lanes, ip] != INSTR.END]
+            if not len(lanes):
+                break
+
+        step_batch(states, lanes)
+        executed[lanes] += 1
+
+    return executed
@@ -0,0 +1,124 @@
+# benchmark.py
+
+import argparse
+import time
+from pathlib import Path
+from typing import Callable
+
+from compiler import compile_source
+from compiler._constants import MAX_OPT_LEVEL
+from compiler.peephole import Report
+from assembler import INSTR, LOCATION
+from interpreter import cycle, run, run_decoded, run_until_halt, DecodedStream
+
+REPEAT = 2000
+MAX_CYCLES = 100_000
+
+
+def load_programs(test_dir: Path) -> dict[str, bytearray]:
+    """
+    Builds every "outputs" and "concludes" test in the .ltest files of
+    <test_dir>, returning their bytecode by test name.
+    """
+    programs: dict[str, bytearray] = {}
+    for test_path in sorted(test_dir.glob("*.ltest")):
+        for test in test_path.read_text().split(">>>")[1:]:
+            header, _, code = test.partition("\n")
+            title, expectation, *_ = header.split()
+            if expectation not in ("outputs", "concludes"):
+                continue
+
+            programs[title] = compile_source(code)
+
+    return programs
+
+
+def _cycle_until_end(state: bytearray, title: str):
+    for _ in range(MAX_CYCLES):
+        if state[state[LOCATION.INSTR_PTR]] == INSTR.END:
+            break
+        cycle(state)
+
+
+def bench(programs: dict[str, bytearray], engines: dict[str, Callable]):
+    """
+    Runs every program to completion REPEAT times with each engine,
+    printing the time per run in microseconds. An engine is called with a
+    fresh copy of the program's state and the program's title.
+    """
+    print(f"{'program':<32}" + "".join(f"{name:>14}" for name in engines))
+    totals = dict.fromkeys(engines, 0.0)
+    for title, image in programs.items():
+        line = f"{title:<32}"
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            for _ in range(REPEAT):
+                engine(bytearray(image), title)
+            elapsed = (time.perf_counter() - start) / REPEAT * 1e6
+            totals[name] += elapsed
+            line += f"{elapsed:>14.1f}"
+        print(line)
+
+    print(f"{'total':<32}" + "".join(f"{totals[name]:>14.1f}" for name in engines))
+
+
+def compare_opt_levels(
+    source: str, max_cycles: int
+) -> list[tuple[Report, int, int]]:
+    """
+    Compiles .lcom source code at every optimization level and runs it,
+    returning the peephole optimizer's report, the size of the code in
+    bytes and the number of cycles the program ran for at each level.
+    """
+    results = []
+    for level in range(MAX_OPT_LEVEL + 1):
+        report = Report()
+        code_lines: list[int] = []
+        state = compile_source(
+            source, source_map=code_lines, opt_level=level, report=report
+        )
+        cycles = run_until_halt(state, max_cycles).cycles
+        results.append((report, len(code_lines), cycles))
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Lens engines.")
+    parser.add_argument(
+        "--opt-levels",
+        type=Path,
+        metavar="PROGRAM",
+        help="compare the bytes and cycles saved at each optimization level "
+        "on a .lcom program instead",
+    )
+    parser.add_argument("-c", "--max-cycles", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.opt_levels:
+        results = compare_opt_levels(args.opt_levels.read_text(), args.max_cycles)
+        _, base_size, base_cycles = results[0]
+        for level, (report, size, cycles) in enumerate(results):
+            print(
+                f"-O{level}: {base_size - size:>4} bytes saved ({size} bytes), "
+                f"{base_cycles - cycles:>8} cycles saved ({cycles} cycles)"
+            )
+            for rule, count in report.rewrites.items():
+                print(f"    {rule:<26} {count:>6}")
+        parser.exit()
+
+    programs = load_programs(Path("tests/"))
+    # Decoded streams are built once per program, like a loader would, so
+    # only their effect on execution is measured.
+    streams = {title: DecodedStream(image) for title, image in programs.items()}
+
+    bench(
+        programs,
+        {
+            "cycle": _cycle_until_end,
+            "run": lambda state, title: run(state, MAX_CYCLES),
+            "run_decoded": lambda state, title: run_decoded(
+                state, MAX_CYCLES, stream=streams[title]
+            ),
+        },
+    )
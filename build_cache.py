@@ -0,0 +1,209 @@
+# build_cache.py
+
+import functools
+import hashlib
+import io
+import json
+import mmap
+import os
+import tempfile
+from pathlib import Path
+
+import compiler
+import assembler
+
+from _constants import FILE_EXT, TOOLCHAIN_VERSION
+from compiler._constants import DEFAULT_OPT_LEVEL
+
+DEFAULT_CACHE_DIR = Path(".lens_cache")
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+IMAGE_SIZE = 0x100
+SOURCE_MAP_EXT = "map.json"
+
+# Modules whose source determines the bytecode built from a program
+_TOOLCHAIN_MODULES = (compiler, assembler)
+
+
+@functools.cache
+def toolchain_digest() -> str:
+    """
+    Returns a digest of TOOLCHAIN_VERSION and the source of the compiler and
+    assembler, so that editing either never reuses stale builds.
+    """
+    digest = hashlib.sha256(str(TOOLCHAIN_VERSION).encode())
+    for module in _TOOLCHAIN_MODULES:
+        path = Path(module.__file__)
+        if path.stem == "__init__":
+            paths = sorted(path.parent.glob("*.py"))
+        else:
+            paths = [path]
+
+        for source_path in paths:
+            digest.update(source_path.read_bytes())
+
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """
+    An on-disk cache of assembled images, stored as .lbin files named after
+    the SHA-256 of the program's source, its file type, the optimization
+    level and the toolchain (see toolchain_digest()). Changing any of them
+    therefore builds the program again.
+
+    Files are written atomically (to a temporary file that is then renamed
+    into place), so concurrent builds of the same program are safe. Once
+    the cache grows past <max_bytes>, the least recently used entries are
+    deleted.
+    """
+
+    def __init__(
+        self, directory: Path | str = DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(source: str, ext: str, opt_level: int = DEFAULT_OPT_LEVEL) -> str:
+        """
+        Returns the cache key of a program with the given source, file
+        extension and optimization level.
+        """
+        header = f"{toolchain_digest()}\0{ext}\0{opt_level}\0"
+        digest = hashlib.sha256(header.encode())
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def image_path(self, key: str) -> Path:
+        return self.directory / f"{key}.{FILE_EXT.BYTECODE.value}"
+
+    def source_map_path(self, key: str) -> Path:
+        return self.directory / f"{key}.{SOURCE_MAP_EXT}"
+
+    def load(self, key: str) -> bytearray | None:
+        """
+        Returns a copy of the cached image for <key>, or None if there is
+        none. A hit marks the entry as recently used.
+        """
+        path = self.image_path(key)
+        try:
+            with open(path, "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+                    state = bytearray(image)
+        except (FileNotFoundError, ValueError):
+            # ValueError: mmap() refuses empty files
+            return None
+
+        if len(state) != IMAGE_SIZE:
+            return None
+
+        os.utime(path)
+        return state
+
+    def load_source_map(self, key: str) -> dict | None:
+        """
+        Returns the source map stored alongside the image for <key>, or
+        None if there is none.
+        """
+        try:
+            with open(self.source_map_path(key), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: Path, data: bytes):
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, prefix=".tmp-", delete=False
+        ) as file:
+            file.write(data)
+
+        os.replace(file.name, path)
+
+    def store(self, key: str, state: bytearray, source_map: dict | None = None):
+        """
+        Adds the image (and optionally its source map) to the cache under
+        <key>, then evicts old entries if the cache is too large.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if source_map is not None:
+            self._write(self.source_map_path(key), json.dumps(source_map).encode())
+        self._write(self.image_path(key), bytes(state))
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in
+        <max_bytes>.
+        """
+        entries = []
+        total = 0
+        for path in self.directory.glob(f"*.{FILE_EXT.BYTECODE.value}"):
+            key = path.name.split(".")[0]
+            paths = [path, self.source_map_path(key)]
+            try:
+                stats = [p.stat() for p in paths if p.exists()]
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                continue
+
+            size = sum(stat.st_size for stat in stats)
+            entries.append((stats[0].st_mtime, size, paths))
+            total += size
+
+        entries.sort(key=lambda entry: entry[0])
+        for _, size, paths in entries:
+            if total <= self.max_bytes:
+                break
+
+            for path in paths:
+                path.unlink(missing_ok=True)
+            total -= size
+
+    def build(self, program: Path | str) -> bytearray:
+        """
+        Returns the bytecode of a .lcom or .lasm program, compiling and
+        assembling it only if it is not already cached.
+        """
+        program = Path(program)
+        return self.build_source(program.read_text(), program.suffix[1:])
+
+    def build_source(
+        self,
+        source: str,
+        ext: str = FILE_EXT.COMPILABLE.value,
+        opt_level: int = DEFAULT_OPT_LEVEL,
+    ) -> bytearray:
+        """
+        Like build(), but takes the source code and file extension of the
+        program directly. .lcom source is compiled at <opt_level>.
+        """
+        key = self.key(source, ext, opt_level)
+        state = self.load(key)
+        if state is None:
+            state, source_map = _build(source, ext, opt_level)
+            self.store(key, state, source_map)
+
+        return state
+
+
+def _build(source: str, ext: str, opt_level: int) -> tuple[bytearray, dict]:
+    """
+    Compiles (at <opt_level>) and assembles .lcom source code, or just
+    assembles .lasm source code, returning its image and a source map
+    holding the assembly and the line every byte of code was assembled
+    from.
+    """
+    if ext == FILE_EXT.COMPILABLE.value:
+        lasm = compiler.compile_to_assembly(source, opt_level)
+    else:
+        lasm = source
+
+    lines: list[int] = []
+    state = assembler.masm_to_bytecode(io.StringIO(lasm), lines)
+    source_map = {
+        "assembly": lasm,
+        "code_start": assembler.LOCATION.HEADER_END,
+        "lines": lines,
+    }
+    return state, source_map
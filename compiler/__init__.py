@@ -2,8 +2,47 @@
 
 __all__ = ["mast_compiler.py", "mast_generator.py", "mast.py", "reader.py"]
 
+import io
+
+import assembler
 from compiler.mast_generator import generate_mast
 from compiler.mast_compiler import compile_mast
+from compiler.peephole import Report
+from compiler._constants import DEFAULT_OPT_LEVEL
+
+
+def compile_to_assembly(
+    source: str, opt_level: int = DEFAULT_OPT_LEVEL, report: Report | None = None
+) -> str:
+    """
+    Compiles .lcom source code into .lasm assembly text, without touching
+    the file system. <opt_level> and <report> are passed on to
+    compile_mast().
+    """
+    root = generate_mast(io.StringIO(source))
+    return compile_mast(root, opt_level=opt_level, report=report)
+
+
+def compile_source(
+    source: str,
+    lasm_path: str | None = None,
+    source_map: list[int] | None = None,
+    opt_level: int = DEFAULT_OPT_LEVEL,
+    report: Report | None = None,
+) -> bytearray:
+    """
+    Compiles and assembles .lcom source code into bytecode in memory.
+
+    The intermediate assembly is only written out if <lasm_path> is given,
+    as a debugging aid. <source_map> is passed on to
+    assembler.masm_to_bytecode().
+    """
+    compiled = compile_to_assembly(source, opt_level, report)
+    if lasm_path is not None:
+        with open(lasm_path, "w") as file:
+            file.write(compiled)
+
+    return assembler.masm_to_bytecode(io.StringIO(compiled), source_map)
 
 
 def compile(filename: str, outfilename: str):
@@ -15,9 +54,7 @@ def compile(filename: str, outfilename: str):
 
     """
     with open(filename, "r") as file:
-        root = generate_mast(file)
-        # print(root)
-    compiled = compile_mast(root)
+        compiled = compile_to_assembly(file.read())
     with open(outfilename, "w") as file:
         file.write(compiled)
 
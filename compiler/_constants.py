@@ -3,11 +3,16 @@
 from typing import NamedTuple
 
 
-SYMBOL_CHARS = "#+-*/=(){}"
+SYMBOL_CHARS = "#+-*/%=(){}[]"
 LONG_SYMBOLS = ["++", "+="]
 SEPARATORS = ";\n"
 
-EXPR_OPS = "=+-*/()"
+# Optimization levels: 0 turns the optimizers off, and 2 only keeps the
+# values a program outputs (not the final values of its variables)
+DEFAULT_OPT_LEVEL = 1
+MAX_OPT_LEVEL = 2
+
+EXPR_OPS = "=+-*/%()"
 EXPR_OP_PRECEDENCE = {
     "(": -1,
     ")": -1,
@@ -16,6 +21,7 @@ EXPR_OP_PRECEDENCE = {
     "-": 1,
     "*": 2,
     "/": 2,
+    "%": 2,
 }
 
 
@@ -30,6 +36,7 @@ EXPR_INSTRS = {
     "-": _InstrSet("SUB", "SUBC"),
     "*": _InstrSet("MUL", "MULC"),
     "/": _InstrSet("DIV", "DIVC"),
+    "%": _InstrSet("MOD", "MODC"),
 }
 
 SYMBOLS = list(SYMBOL_CHARS) + LONG_SYMBOLS
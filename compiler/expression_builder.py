@@ -4,7 +4,12 @@ from typing import Iterator
 
 import compiler.mast as mast
 from compiler._constants import EXPR_OPS, EXPR_OP_PRECEDENCE, EXPR_INSTRS
-from compiler.namespace import Namespace
+from compiler.instructions import Instr
+from compiler.liveness import expression_reads
+from compiler.namespace import Namespace, Var
+
+# Instructions whose second operand is an address
+_ADDR_INSTRS = {instrs.ADDR for instrs in EXPR_INSTRS.values()}
 
 Component = mast.Identifier | mast.Literal | mast.Expression
 
@@ -24,130 +29,352 @@ def _str_to_mast(string: str) -> mast.Expression:
 
 def build_expression(tokens: list[str]) -> mast.Expression:
     """
-    Builds an Expression from a list of tokens.
+    Builds an Expression from a list of tokens in a single pass, using the
+    shunting-yard algorithm. Operators of equal precedence associate to the
+    left, so "a - b - c" is built as ((a - b) - c).
     """
-    # Convert all tokens (strings) to MAST objects.
-    tokens = [_str_to_mast(t) for t in tokens]
-    operators = [op for op in tokens if isinstance(op, mast.Operator)]
+    operands: list[Component] = []
+    operators: list[mast.Operator] = []
+
+    def reduce():
+        # Combine the topmost operator with the two topmost operands
+        right = operands.pop()
+        left = operands.pop()
+        operands.append(mast.Expression(left, operators.pop(), right))
 
-    # Iterate through the list of tokens, assigning a precedence to each
-    # operator. Precedence is determined by parentheses, as well as
-    # the precedence value of the operator in EXPR_OP_PRECEDENCE.
-    scope = 0
+    # Whether the next token must be an operand (or an opening parenthesis)
+    expect_operand = True
     for token in tokens:
-        if isinstance(token, mast.Operator):
-            if token.value == "(":
-                scope += 10
-            elif token.value == ")":
-                scope -= 10
+        match _str_to_mast(token):
+            case mast.Operator("(") as paren:
+                if not expect_operand:
+                    raise mast.MASTError(f"Invalid expression {tokens!r}")
+                operators.append(paren)
+
+            case mast.Operator(")"):
+                if expect_operand:
+                    raise mast.MASTError(f"Invalid expression {tokens!r}")
+                while operators and operators[-1].value != "(":
+                    reduce()
+                if not operators:
+                    raise mast.MASTError(
+                        f"Unbalanced parentheses in expression {tokens!r}"
+                    )
+                operators.pop()
 
-            token_precedence = EXPR_OP_PRECEDENCE[token.value] + scope
-            token._p = token_precedence
+            case mast.Operator(value) as operator:
+                if expect_operand:
+                    raise mast.MASTError(
+                        f"Invalid operator {value!r} in expression {tokens!r}"
+                    )
+
+                # Everything of higher or equal precedence to the left of the
+                # operator becomes its left side
+                precedence = EXPR_OP_PRECEDENCE[value]
+                while (
+                    operators
+                    and EXPR_OP_PRECEDENCE[operators[-1].value] >= precedence
+                ):
+                    reduce()
+                operators.append(operator)
+                expect_operand = True
+
+            case operand:
+                if not expect_operand:
+                    raise mast.MASTError(f"Invalid expression {tokens!r}")
+                operands.append(operand)
+                expect_operand = False
+
+    if expect_operand:
+        raise mast.MASTError(f"Invalid expression {tokens!r}")
 
-    # Check for equal amount of opening and closing parentheses
-    if scope != 0:
-        raise mast.MASTError(f"Unbalanced parentheses in expression {tokens!r}")
+    while operators:
+        if operators[-1].value == "(":
+            raise mast.MASTError(f"Unbalanced parentheses in expression {tokens!r}")
+        reduce()
 
-    # Remove all parentheses operators from the list of tokens as well
-    # as the set of operators; they are no longer needed
-    for op in operators:
-        if op.value in "()":
-            tokens.remove(op)
+    return operands[0]
 
-    operators = [op for op in operators if op.value not in "()"]
 
-    while operators:
-        # Pop the operator with the highest precedence
-        highest = max(operators, key=lambda op: op._p)
-        operators.remove(highest)
-
-        # Get the index of the operator
-        op_index = tokens.index(highest)
-        match highest.value:
-            case op if op in ("=", "+", "-", "*", "/"):
-                # Get the left and right sides of the assignment
-                left_index = op_index - 1
-                right_index = op_index + 1
-                try:
-                    left = tokens[left_index]
-                    right = tokens[right_index]
-                except IndexError:
-                    tokens_str = "\n\t".join(repr(t) for t in tokens)
-                    raise mast.MASTError(
-                        f"Invalid operator in expression \n\t{tokens_str}"
-                    )
+def _scalar(ns: Namespace, name: str) -> Var:
+    """
+    Returns the variable with the given name, which cannot be an array.
+    """
+    var = ns[name]
+    if var.size is not None:
+        raise mast.MASTError(f"Array {name!r} cannot be used in an expression")
 
-                tokens[left_index : right_index + 1] = [
-                    mast.Expression(left, highest, right)
-                ]
+    return var
 
-    if len(tokens) != 1:
-        raise mast.MASTError(f"Invalid expression {tokens!r}")
 
-    return tokens[0]
+class _Slots:
+    """
+    Allocates the temporary slots used while compiling one statement: the
+    addresses no variable occupies, lowest first. Slots are returned once
+    their value has been used, so the same few are reused throughout.
+    """
 
+    def __init__(self, ns: Namespace):
+        # Bit <n> is set if address <n> is free
+        self._free = ns.free_bitmap()
 
-def expr_to_masm(expr: mast.Expression, ns: Namespace) -> list[str]:
-    output: list[str] = []
+    def take(self) -> int:
+        if not self._free:
+            raise mast.MASTError("Expression needs too many temporary values")
 
-    addr_instr, const_instr = EXPR_INSTRS[expr.operator.value]
-    free_addrs = ns.get_free_addresses()
+        lowest = self._free & -self._free
+        self._free ^= lowest
+        return lowest.bit_length() - 1
 
-    if expr.operator.value == "=":
-        if not isinstance(expr.left, mast.Identifier):
-            raise mast.MASTError(f"Can only assign to identifiers.")
+    def give_back(self, addr: int):
+        self._free |= 1 << addr
 
-        if isinstance(expr.right, mast.Identifier):
-            output.append(
-                f"MOV {ns[expr.left.value].addr_as_str} {ns[expr.right.value].addr_as_str}"
-            )
 
-        elif isinstance(expr.right, mast.Literal):
-            output.append(f"SET {ns[expr.left.value].addr_as_str} {expr.right.value}")
+def _needs(expr: Component, needs: dict[mast.MAST, int]) -> int:
+    """
+    Fills in <needs> with the number of slots each subexpression takes to
+    evaluate (its Sethi-Ullman number) and returns that of <expr>. A right
+    operand that is a literal or identifier is used directly and needs no
+    slot of its own.
+    """
+    if not isinstance(expr, mast.Expression):
+        return 1
 
-        elif isinstance(expr.right, mast.Expression):
-            output.extend(expr_to_masm(expr.right, ns))
-            output.append(
-                f"MOV {ns[expr.left.value].addr_as_str} {ns.addr_as_str(free_addrs[0])}"
-            )
+    left = _needs(expr.left, needs)
+    if isinstance(expr.right, mast.Expression):
+        right = _needs(expr.right, needs)
+        need = left + 1 if left == right else max(left, right)
+    else:
+        need = left
 
-        else:
-            raise mast.MASTError(f"Invalid assignment")
+    needs[expr] = need
+    return need
 
-        return output
 
-    # Guaranteed that operator is not '='
+def _first_operand(expr: Component) -> Component:
+    """
+    Returns the operand whose value the expression is accumulated onto.
+    """
+    while isinstance(expr, mast.Expression):
+        expr = expr.left
 
-    # Ensure that free_addrs[0] contains the evaluated value of expr.left
-    if isinstance(expr.left, mast.Identifier):
-        output.append(f"MOV {free_addrs[0]} {ns[expr.left.value].addr_as_str}")
+    return expr
 
-    elif isinstance(expr.left, mast.Literal):
-        output.append(f"SET {free_addrs[0]} {expr.left.value}")
 
-    elif isinstance(expr.left, mast.Expression):
-        output.extend(expr_to_masm(expr.left, ns))
+class _ExpressionCompiler:
+    """
+    Compiles one statement's expression into instructions. Every operator
+    takes its left operand's slot as destination, so the deeper operand of
+    each operator is evaluated first to keep the fewest values alive.
+
+    Variables not in <live> (other than those in <kept>) are not read after
+    the statement, so a subexpression starting with one of them may be
+    evaluated in its slot rather than in a temporary one (each at most
+    once). If <live> is None, every variable is kept.
+    """
 
-    # Compute the value of the right side of the expression if necessary,
-    # storing it in free_addrs[1]. Then, augmented-add expr.right to expr.left.
-    if isinstance(expr.right, mast.Identifier):
-        if expr.right.value not in ns:
-            raise Exception(f"Unknown identifier {expr.right!r}")
+    def __init__(self, ns: Namespace, live: set[str] | None, kept: set[str]):
+        self.ns = ns
+        self.live = live
+        self.kept = set(kept)
+        self.slots = _Slots(ns)
+        self.needs: dict[mast.MAST, int] = {}
+        self.output: list[Instr] = []
+        # Addresses of variables whose value is overwritten
+        self.overwritten: set[str] = set()
+        # Indices in the output of the instructions that read back the
+        # result a subexpression left in a variable's slot
+        self.consuming: set[int] = set()
+
+    def _operand(self, operand: Component) -> str:
+        if isinstance(operand, mast.Identifier):
+            return _scalar(self.ns, operand.value).addr_as_str
+
+        return str(operand.value)
+
+    def _take_slot(self, expr: Component) -> tuple[int, bool]:
+        """
+        Returns the address to evaluate <expr> into, and whether it is a
+        temporary slot (rather than a dead variable's).
+        """
+        first = _first_operand(expr)
+        if (
+            self.live is not None
+            and isinstance(first, mast.Identifier)
+            and first.value not in self.live
+            and first.value not in self.kept
+        ):
+            self.kept.add(first.value)
+            var = self.ns[first.value]
+            self.overwritten.add(var.addr_as_str)
+            return var.addr, False
+
+        return self.slots.take(), True
+
+    def evaluate(self, expr: Component, target: int):
+        """
+        Appends the instructions that store the value of <expr> at address
+        <target>.
+        """
+        target_str = Namespace.addr_as_str(target)
+        match expr:
+            case mast.Identifier():
+                source = self._operand(expr)
+                if source != target_str:
+                    self.output.append(Instr("MOV", (target_str, source)))
+
+            case mast.Literal():
+                self.output.append(Instr("SET", (target_str, str(expr.value))))
+
+            case mast.Expression(_, mast.Operator("=")):
+                raise mast.MASTError(f"Assignments cannot be nested in {expr!r}")
+
+            case mast.Expression(left, operator, right):
+                addr_instr, const_instr = EXPR_INSTRS[operator.value]
+                if isinstance(right, mast.Literal):
+                    self.evaluate(left, target)
+                    instr = Instr(const_instr, (target_str, str(right.value)))
+
+                elif isinstance(right, mast.Identifier):
+                    self.evaluate(left, target)
+                    instr = Instr(addr_instr, (target_str, self._operand(right)))
+
+                else:
+                    right_first = self.needs[right] > self.needs.get(left, 1)
+                    if not right_first:
+                        self.evaluate(left, target)
+
+                    slot, is_temp = self._take_slot(right)
+                    self.evaluate(right, slot)
+                    if right_first:
+                        self.evaluate(left, target)
+
+                    slot_str = Namespace.addr_as_str(slot)
+                    instr = Instr(addr_instr, (target_str, slot_str))
+                    if is_temp:
+                        self.slots.give_back(slot)
+                    else:
+                        self.consuming.add(len(self.output))
+
+                self.output.append(instr)
+
+    def compile(self, expr: Component, target: int) -> list[Instr]:
+        """
+        Compiles <expr>, storing its value at address <target>.
+        """
+        _needs(expr, self.needs)
+        self.evaluate(expr, target)
+        return self.output
+
+
+def _reads_overwritten(
+    instrs: list[Instr], overwritten: set[str], consuming: set[int]
+) -> bool:
+    """
+    Returns whether any of the instructions reads a variable in
+    <overwritten> (given by address) after that variable has been written,
+    i.e. expects its original value. The instructions at the indices in
+    <consuming> read the value computed in the slot instead, which is
+    allowed.
+    """
+    written: set[str] = set()
+    for index, instr in enumerate(instrs):
+        dest, source = instr.operands
+        if (
+            instr.op in _ADDR_INSTRS
+            and source in written
+            and index not in consuming
+        ):
+            return True
+        if dest in overwritten:
+            written.add(dest)
+
+    return False
+
+
+def _array_assignment(dest: Var, value: Component, ns: Namespace) -> list[Instr]:
+    """
+    Compiles assigning a value to every element of the array <dest>: a
+    literal fills the array and an array of the same size is copied. Any
+    other value is evaluated once into the first element, which is then
+    copied on, doubling the filled part each time.
+    """
+    size = str(dest.size)
+    match value:
+        case mast.Literal():
+            return [Instr("MEMSET", (dest.addr_as_str, str(value.value), size))]
+
+        case mast.Identifier() if ns[value.value].size is not None:
+            if ns[value.value].size != dest.size:
+                raise mast.MASTError(
+                    f"Can only copy an array of size {dest.size} to array "
+                    f"{dest.name!r}"
+                )
+            source = ns[value.value].addr_as_str
+            return [Instr("MEMCPY", (dest.addr_as_str, source, size))]
+
+    # Arrays cannot be read in expressions, so the first element is free to
+    # evaluate in
+    output = _ExpressionCompiler(ns, None, set()).compile(value, dest.addr)
+    filled = 1
+    while filled < dest.size:
+        count = min(filled, dest.size - filled)
+        rest = Namespace.addr_as_str(dest.addr + filled)
+        output.append(Instr("MEMCPY", (rest, dest.addr_as_str, str(count))))
+        filled += count
 
-        output.append(
-            f"{addr_instr} {free_addrs[0]} {ns[expr.right.value].addr_as_str}"
-        )
+    return output
 
-    elif isinstance(expr.right, mast.Literal):
-        output.append(f"{const_instr} {free_addrs[0]} {expr.right.value}")
 
-    if isinstance(expr.right, mast.Expression):
-        tmp = ns.add_identifier("__expr_segment", "tmp")
-        output.extend(expr_to_masm(expr.right, ns))
+def expr_to_instrs(
+    expr: mast.Expression, ns: Namespace, live_after: set[str] | None = None
+) -> list[Instr]:
+    """
+    Compiles an expression statement into instructions.
 
-        ns.vars.remove(tmp)
-        output.append(f"{addr_instr} {free_addrs[0]} {free_addrs[1]}")
+    An assignment's value is evaluated directly in the assigned variable's
+    slot where possible. <live_after> holds the variables that may be read
+    after the statement (all of them if None); the slots of the others are
+    used as scratch space too, and assigning one of them compiles to
+    nothing.
 
+    Assigning to an array fills or copies it as a whole (see
+    _array_assignment()).
+    """
+    if expr.operator.value != "=":
+        # Evaluated for nothing but its errors
+        compiler = _ExpressionCompiler(ns, None, set())
+        return compiler.compile(expr, compiler.slots.take())
+
+    if not isinstance(expr.left, mast.Identifier):
+        raise mast.MASTError(f"Can only assign to identifiers.")
+
+    dest = ns[expr.left.value]
+    dead = live_after is not None and dest.name not in live_after
+    if dest.size is not None:
+        output = _array_assignment(dest, expr.right, ns)
+        return [] if dead else output
+
+    if dead:
+        # The value is never read, so the assignment is left out (once its
+        # variables are known to be usable)
+        for name in expression_reads(expr.right):
+            _scalar(ns, name)
+        return []
+
+    # Evaluating in place is only valid if no overwritten variable is read
+    # afterwards, so fall back to fewer in-place slots until that holds
+    for live in (live_after, None) if live_after is not None else (None,):
+        compiler = _ExpressionCompiler(ns, live, {dest.name})
+        compiler.overwritten.add(dest.addr_as_str)
+        output = compiler.compile(expr.right, dest.addr)
+        if not _reads_overwritten(output, compiler.overwritten, compiler.consuming):
+            return output
+
+    compiler = _ExpressionCompiler(ns, None, set())
+    temp = compiler.slots.take()
+    output = compiler.compile(expr.right, temp)
+    output.append(Instr("MOV", (dest.addr_as_str, Namespace.addr_as_str(temp))))
     return output
 
 
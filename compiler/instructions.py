@@ -0,0 +1,106 @@
+# instructions.py
+
+from typing import NamedTuple
+
+
+class Label:
+    """
+    A position in an instruction list. Jumps refer to labels rather than to
+    offsets, which are only worked out by render().
+
+    Named labels are also written to the assembly as "&<name>" macros, as
+    needed for &MAIN.
+    """
+
+    def __init__(self, name: str | None = None):
+        self.name = name
+
+    def __repr__(self):
+        return f"Label({self.name!r})" if self.name else f"Label(@{id(self):x})"
+
+
+class Comment(NamedTuple):
+    text: str
+
+
+Operand = str | int | Label
+
+
+class Instr(NamedTuple):
+    """
+    An instruction and its operands, each of which assembles to one byte.
+    Operands are assembler words ("@A", "5"), numbers or Labels.
+    """
+
+    op: str
+    operands: tuple[Operand, ...] = ()
+
+    def __repr__(self):
+        return " ".join(str(word) for word in (self.op, *self.operands))
+
+    @property
+    def size(self) -> int:
+        return 1 + len(self.operands)
+
+    @classmethod
+    def parse(cls, line: str) -> "Instr":
+        """
+        Creates an instruction from a line of assembly, e.g. "ADDC @A 1".
+        """
+        op, *operands = line.split()
+        return cls(op, tuple(operands))
+
+
+Item = Instr | Label | Comment
+
+
+def size_of(items: list[Item]) -> int:
+    """
+    Returns the number of bytes the items assemble to.
+    """
+    return sum(item.size for item in items if isinstance(item, Instr))
+
+
+def render(items: list[Item]) -> str:
+    """
+    Returns the items as assembly text, resolving labels in a single pass
+    over the list (plus one to find them).
+
+    A label operand becomes an "@LEN+n" or "@LEN-n" macro relative to the
+    operand's own position, so the result does not depend on where the
+    assembler places the code.
+    """
+    positions: dict[Label, int] = {}
+    position = 0
+    for item in items:
+        if isinstance(item, Label):
+            positions[item] = position
+        elif isinstance(item, Instr):
+            position += item.size
+
+    lines: list[str] = []
+    position = 0
+    for item in items:
+        match item:
+            case Label(name=None):
+                pass
+
+            case Label():
+                lines.append(f"&{item.name}")
+
+            case Comment():
+                lines.append(f"    # {item.text}")
+
+            case Instr():
+                words = [item.op]
+                for index, operand in enumerate(item.operands, 1):
+                    if isinstance(operand, Label):
+                        offset = positions[operand] - (position + index)
+                        sign = "-" if offset < 0 else "+"
+                        operand = f"@LEN{sign}{abs(offset)}"
+                    words.append(str(operand))
+
+                lines.append("        " + " ".join(words))
+                position += item.size
+
+    return "\n".join(lines) + "\n"
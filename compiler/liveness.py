@@ -0,0 +1,177 @@
+# liveness.py
+
+import compiler.mast as mast
+
+# Maps each expression statement to the names of the variables whose values
+# may still be read after it
+LiveMap = dict[mast.MAST, set[str]]
+
+
+def expression_reads(node: mast.MAST) -> set[str]:
+    """
+    Returns the names of the variables read by an expression (or a single
+    operand).
+    """
+    match node:
+        case mast.Identifier():
+            return {node.value}
+
+        case mast.Expression(left, mast.Operator("="), right):
+            if isinstance(left, mast.Identifier):
+                return expression_reads(right)
+            return expression_reads(left) | expression_reads(right)
+
+        case mast.Expression(left, _, right):
+            return expression_reads(left) | expression_reads(right)
+
+    return set()
+
+
+def _assigned(node: mast.MAST) -> set[str]:
+    """
+    Returns the name of the variable assigned by a statement, if any.
+    """
+    match node:
+        case mast.Expression(mast.Identifier(value=value), mast.Operator("=")):
+            return {value}
+
+        case mast.BinOp(mast.Identifier(value=value), mast.Operator("=")):
+            return {value}
+
+    return set()
+
+
+def body_reads(parent: mast.MAST) -> set[str]:
+    """
+    Returns the names of every variable read in the MAST's body, excluding
+    nested functions.
+    """
+    names: set[str] = set()
+    for child in parent.body:
+        match child:
+            case mast.Expression():
+                names |= expression_reads(child)
+
+            case mast.BinOp(left, operator, right):
+                if operator.value != "=":
+                    names |= expression_reads(left)
+                names |= expression_reads(right)
+
+            case mast.If() | mast.While():
+                names |= expression_reads(child.condition) | body_reads(child)
+
+            case mast.Print():
+                names |= expression_reads(child.value)
+
+    return names
+
+
+def _all_names(parent: mast.MAST) -> set[str]:
+    """
+    Returns the names of every variable declared or read in the MAST's body,
+    excluding nested functions.
+    """
+    names: set[str] = set()
+    for child in parent.body:
+        match child:
+            case mast.VarDef():
+                names.add(child.identifier.value)
+
+            case mast.Expression() | mast.BinOp():
+                names |= _assigned(child) | expression_reads(child)
+
+            case mast.If() | mast.While():
+                names |= expression_reads(child.condition) | _all_names(child)
+
+            case mast.Print():
+                names |= expression_reads(child.value)
+
+    return names
+
+
+def _declared(parent: mast.MAST, names: set[str]) -> frozenset[str]:
+    """
+    Returns the names in <names> that are declared in the MAST's body.
+    """
+    return frozenset(
+        child.identifier.value
+        for child in parent.body
+        if isinstance(child, mast.VarDef) and child.identifier.value in names
+    )
+
+
+def _live_before(
+    parent: mast.MAST,
+    live: set[str],
+    live_map: LiveMap,
+    shadowed: frozenset[str] = frozenset(),
+    final_values_live: bool = True,
+) -> set[str]:
+    """
+    Given the variables live after the MAST's body, records the variables
+    live after each expression statement in it and returns the variables
+    live before it.
+
+    Assigning a name in <shadowed> never ends its life: the name may refer
+    to a variable declared in the body, while an enclosing scope's variable
+    of the same name is still live.
+    """
+    if isinstance(parent, (mast.Root, mast.FunctionDef)) and final_values_live:
+        live = live | _all_names(parent)
+
+    for child in reversed(parent.body):
+        match child:
+            case mast.Expression():
+                live_map[child] = live
+                live = (live - (_assigned(child) - shadowed)) | expression_reads(child)
+
+            case mast.BinOp(left, mast.Operator("="), right):
+                live = (live - (_assigned(child) - shadowed)) | expression_reads(right)
+
+            case mast.BinOp(left, _, right):
+                live = live | expression_reads(left) | expression_reads(right)
+
+            case mast.Print():
+                live = live | expression_reads(child.value)
+
+            case mast.If():
+                condition = expression_reads(child.condition)
+                body_shadowed = shadowed | _declared(child, live)
+                body_live = _live_before(
+                    child, live, live_map, body_shadowed, final_values_live
+                )
+                live = body_live | live | condition
+
+            case mast.While():
+                # The body may run again after itself, so iterate until the
+                # variables live at the start of the loop stop growing
+                exit_live = live | expression_reads(child.condition)
+                loop_live = exit_live
+                while True:
+                    body_shadowed = shadowed | _declared(child, loop_live)
+                    body_live = _live_before(
+                        child, loop_live, live_map, body_shadowed, final_values_live
+                    )
+                    if body_live <= loop_live:
+                        break
+                    loop_live = loop_live | body_live
+                live = loop_live
+
+            case mast.FunctionDef():
+                _live_before(child, set(), live_map, frozenset(), final_values_live)
+
+    return live
+
+
+def live_variables(root: mast.Root, final_values_live: bool = True) -> LiveMap:
+    """
+    Returns the variables live after each expression statement of the MAST,
+    i.e. those that a later statement may read before assigning them.
+
+    If <final_values_live>, every variable is live at the end of a function,
+    where its final value can still be observed (by "concludes" tests, for
+    example). Otherwise only the values output matter.
+    """
+    live_map: LiveMap = {}
+    _live_before(root, set(), live_map, final_values_live=final_values_live)
+    return live_map
@@ -12,13 +12,14 @@ class MAST:
     def __repr__(self):
         type_name = type(self).__name__
 
-        # Remove the 'open' and 'body' attributes from self.__dict__
-        # for a cleaner repr() output.
+        # Remove the 'open', 'body' and (for the root) 'scopes' attributes
+        # from self.__dict__ for a cleaner repr() output.
         dict_clean = self.__dict__.copy()
         if not dict_clean["open"]:
             del dict_clean["open"]
 
         del dict_clean["body"]
+        dict_clean.pop("scopes", None)
 
         # Construct a string representation of the MAST with
         # its attributes.
@@ -64,36 +65,30 @@ class Root(MAST):
     def __init__(self):
         super().__init__()
         self.open = True
+        # The open MASTs, outermost (the root itself) first. New MASTs are
+        # added to the last one.
+        self.scopes: list[MAST] = [self]
 
     def add(self, mast: MAST):
         """
-        Adds the given MAST to the root.
+        Adds the given MAST to the innermost open MAST (or to the root
+        once everything has been closed). If the given MAST is itself
+        open, it becomes the innermost one.
         """
-        # Find the innermost open MAST and add the given MAST to it.
-        candidate = self
-        while candidate.open and candidate.has_body() and candidate.body[-1].open:
-            candidate = candidate.body[-1]
-
-        candidate.body.append(mast)
+        parent = self.scopes[-1] if self.scopes else self
+        parent.body.append(mast)
+        if mast.open:
+            self.scopes.append(mast)
 
     def close(self):
         """
-        Starting from the root, find the innermost open MAST
-        and close it. If no open MAST is found, raise MASTError.
+        Closes the innermost open MAST, the root included. If no open MAST
+        is left, raise MASTError.
         """
-        # Finds the innermost open MAST by repeatedly accessing the
-        # last element of the MAST's body.
-        mast_hierarchy = [self]
-        while mast_hierarchy[-1].has_body():
-            mast_hierarchy.append(mast_hierarchy[-1].body[-1])
-
-        # Search for an open MAST, and close it.
-        for mast in reversed(mast_hierarchy):
-            if mast.open:
-                mast.open = False
-                return
+        if not self.scopes:
+            raise MASTError(f"Unexpected closing")
 
-        raise MASTError(f"Unexpected closing")
+        self.scopes.pop().open = False
 
 
 class Comment(MAST):
@@ -130,10 +125,14 @@ class Type(MAST):
 
 
 class VarDef(MAST):
-    def __init__(self, type_name: Type, identifier: Identifier):
+    def __init__(
+        self, type_name: Type, identifier: Identifier, size: int | None = None
+    ):
         super().__init__()
         self.type_name = type_name
         self.identifier = identifier
+        # Number of elements of an array, or None for a single value
+        self.size = size
 
 
 class Operator(MAST):
@@ -1,129 +1,209 @@
 # mast_compiler.py
 
 from typing import Optional, TextIO
-import re
 
 import compiler.mast as mast
 
-from compiler.expression_builder import expr_to_masm
+from compiler.expression_builder import expr_to_instrs
+from compiler.instructions import Comment, Instr, Item, Label, render
+from compiler.liveness import LiveMap, live_variables
 from compiler.namespace import Namespace
+from compiler._constants import DEFAULT_OPT_LEVEL
+from compiler.optimizer import eliminate_dead_code, fold_constants
+from compiler.peephole import Report, optimize
 
 
-def _indent_str(string: str, spaces: int = 4) -> str:
+def _is_countdown(loop: mast.While) -> bool:
     """
-    Indents a string by the given number of spaces.
+    Returns whether the loop's body ends by decrementing the variable the
+    loop tests, as in "while n { ...; n = n - 1 }".
     """
-    indent = " " * spaces
-    return indent + string.replace("\n", "\n" + indent)
-
-
-def _remove_comments(string: str) -> str:
+    name = loop.condition.value
+    if not loop.body or any(
+        isinstance(child, mast.VarDef) and child.identifier.value == name
+        for child in loop.body
+    ):
+        # A variable declared in the body would hide the tested one
+        return False
+
+    match loop.body[-1]:
+        case mast.Expression(
+            mast.Identifier(value=dest),
+            mast.Operator("="),
+            mast.Expression(
+                mast.Identifier(value=source),
+                mast.Operator("-"),
+                mast.Literal() as step,
+            ),
+        ):
+            return dest == source == name and str(step.value) == "1"
+
+    return False
+
+
+def _traverse(
+    parent: mast.MAST,
+    parent_namespace: Namespace | None,
+    live_map: LiveMap,
+    body: list[mast.MAST] | None = None,
+) -> list[Item]:
     """
-    Given a string, removes all comments from it. A comment is
-    defined as any substring starting with a '#' and ending with
-    a newline ('\n').
-    """
-    return re.sub(r"#.*?\n", "", string)
-
-
-def _traverse(parent: mast.MAST, parent_namespace: Namespace | None) -> str:
-    """
-    Given a MAST with a body, compiles the body into machine code
-    and return it as a string.
+    Given a MAST with a body, compiles the body into a list of
+    instructions, labels and comments.
 
     The optional parameter 'parent_namespace' can be used to inform the
     compiler about nonlocal variables (such as when compiling an if statement).
+    'live_map' gives the variables live after each expression statement.
+    'body' can be given to compile only some of the MAST's statements.
     """
     namespace = Namespace(parent_namespace)
-    output_str = ""
-    for child in parent.body:
+    output: list[Item] = []
+    for child in parent.body if body is None else body:
         match child:
             case mast.Comment():
-                output_str += f"{child.value}\n"
+                output.append(Comment(child.value.lstrip("#").strip()))
 
             case mast.Literal():
-                output_str += f"{child.value}"
+                output.append(Instr(str(child.value)))
 
             case mast.Identifier():
-                output_str += f"{child.value}"
+                output.append(Instr(child.value))
 
             case mast.Type():
                 pass
 
             case mast.VarDef():
                 var_name = child.identifier.value
-                namespace.add_identifier(var_name, "int")
+                var = namespace.add_identifier(var_name, "int", child.size)
+                if var.size is not None:
+                    # Arrays start out zeroed
+                    zeroed = (var.addr_as_str, "0", str(var.size))
+                    output.append(Instr("MEMSET", zeroed))
 
             case mast.Expression():
-                masm_instrs = expr_to_masm(child, namespace)
-                output_str += f"# {child!r}\n"
-                output_str += _indent_str("\n".join(masm_instrs))
-                output_str += "\n"
+                output.append(Comment(repr(child)))
+                output.extend(expr_to_instrs(child, namespace, live_map.get(child)))
 
             case mast.BinOp(mast.Identifier(), mast.Operator("="), mast.Literal()):
                 var_address = child.left.get_addr_str(namespace)
                 const = child.right.value
-                output_str += f"SET {var_address} {const}\n"
+                output.append(Instr("SET", (var_address, const)))
 
             case mast.BinOp(mast.Identifier(), mast.Operator("="), mast.Identifier()):
                 dest_address = child.left.get_addr_str(namespace)
                 src_address = child.right.get_addr_str(namespace)
-                output_str += f"MOV {dest_address} {src_address}\n"
+                output.append(Instr("MOV", (dest_address, src_address)))
 
             case mast.BinOp(mast.Identifier(), mast.Operator("+="), mast.Literal()):
                 var_address = child.left.get_addr_str(namespace)
                 const = child.right.value
-                output_str += f"ADDC {var_address} {const}\n"
+                output.append(Instr("ADDC", (var_address, const)))
 
             case mast.BinOp(mast.Identifier(), mast.Operator("+="), mast.Identifier()):
                 dest_address = child.left.get_addr_str(namespace)
                 src_address = child.right.get_addr_str(namespace)
-                output_str += f"ADD {dest_address} {src_address}\n"
+                output.append(Instr("ADD", (dest_address, src_address)))
 
             case mast.If(mast.Identifier()):
                 condition_addr = namespace[child.condition.value].addr_as_str
-                body_str = _traverse(child, namespace)
-                body_len = len(_remove_comments(body_str).split())
-
-                output_str += f"JZ {condition_addr} @LEN+{body_len + 1}\n"
-                output_str += _indent_str(body_str)
-                output_str += "\n"
+                end = Label()
+
+                output.append(Instr("JZ", (condition_addr, end)))
+                output.extend(_traverse(child, namespace, live_map))
+                output.append(end)
+
+            case mast.If(mast.Literal()):
+                # The condition is known, so the body either always runs or
+                # is always jumped over. It is compiled either way, so that
+                # its names are checked; from level 1, bodies that never run
+                # have already been checked and removed.
+                body = _traverse(child, namespace, live_map)
+                if int(child.condition.value) % 256:
+                    output.extend(body)
+                else:
+                    end = Label()
+                    output.append(Instr("JMPC", (end,)))
+                    output.extend(body)
+                    output.append(end)
 
             case mast.While(mast.Identifier()):
+                # Inverted loop: the condition is tested once before the
+                # loop, then by a single jump back at the end of the body
                 condition_addr = namespace[child.condition.value].addr_as_str
-                body_str = _traverse(child, namespace)
-                body_len = len(_remove_comments(body_str).split())
-
-                output_str += f"JZ {condition_addr} @LEN+{body_len + 3}\n"
-                output_str += _indent_str(body_str)
-                output_str += f"JMPC @LEN-{body_len + 4}\n"
+                start, end = Label(), Label()
+                countdown = _is_countdown(child)
+                body = child.body[:-1] if countdown else child.body
+
+                output.append(Instr("JZ", (condition_addr, end)))
+                output.append(start)
+                output.extend(_traverse(child, namespace, live_map, body))
+                if countdown:
+                    output.append(Comment(repr(child.body[-1])))
+                    output.append(Instr("DEC", (condition_addr,)))
+                output.append(Instr("JNZ", (condition_addr, start)))
+                output.append(end)
 
             case mast.Print(mast.Identifier()):
                 identifier = child.value
-                output_str += f"OUT {namespace[identifier.value].addr_as_str}\n"
+                addr = namespace[identifier.value].addr_as_str
+                output.append(Instr("OUT", (addr,)))
 
             case mast.Print(mast.Literal()):
                 literal = child.value
-                output_str += f"OUTC {literal.value}\n"
+                output.append(Instr("OUTC", (literal.value,)))
 
             case mast.FunctionDef(name="main"):
-                output_str += f"&MAIN\n"
-                output_str += _indent_str(_traverse(child, None))
-                output_str += "\nEND\n"
+                output.append(Label("MAIN"))
+                output.extend(_traverse(child, None, live_map))
+                output.append(Instr("END"))
 
             case mast.FunctionDef():
-                output_str += f"&{child.name}\n"
-                output_str += _indent_str(_traverse(child, None))
-                output_str += "\nJMPC @A\n"
+                output.append(Label(child.name))
+                output.extend(_traverse(child, None, live_map))
+                output.append(Instr("JMPC", ("@A",)))
 
             case default:
                 raise Exception(f"Unsupported node type: {child}")
 
-    return output_str
+    return output
 
 
-def compile_mast(root: mast.Root, output_file: Optional[TextIO] = None) -> str:
-    output = _traverse(root, None)
+def generate_instructions(
+    root: mast.Root, opt_level: int = DEFAULT_OPT_LEVEL
+) -> list[Item]:
+    """
+    Compiles the MAST into a list of instructions, labels and comments.
+    From level 1, constant expressions are folded and dead code is
+    eliminated (in place) first, as far as <opt_level> allows; level 0
+    compiles the MAST as written.
+
+    From level 1, stores that are overwritten before being read are left
+    out. Level 2 also leaves out stores whose value is never read, as only
+    the values a program outputs are kept.
+    """
+    if opt_level >= 1:
+        fold_constants(root)
+    eliminate_dead_code(root, opt_level)
+    if opt_level < 1:
+        live_map = {}
+    else:
+        live_map = live_variables(root, final_values_live=opt_level < 2)
+
+    return _traverse(root, None, live_map)
+
+
+def compile_mast(
+    root: mast.Root,
+    output_file: Optional[TextIO] = None,
+    opt_level: int = DEFAULT_OPT_LEVEL,
+    report: Report | None = None,
+) -> str:
+    """
+    Compiles the MAST into assembly text, running the peephole optimizer
+    at <opt_level> over it (see peephole.optimize()).
+    """
+    items = optimize(generate_instructions(root, opt_level), opt_level, report)
+    output = render(items)
     if output_file is not None:
         output_file.write(output)
 
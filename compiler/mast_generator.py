@@ -77,13 +77,27 @@ def _process_token(root: mast.Root, reader: Reader):
 
         # If the token is a type name such as 'int', the statement is
         # treated as a variable definition. The next token is read and
-        # stored as the variable name (identifier).
+        # stored as the variable name (identifier). A size in brackets
+        # after the name, as in 'int a[4]', makes the variable an array.
         case ("int" | "var"):
             type_name = mast.Type(token)
             identifier = mast.Identifier(reader.read_token())
             var_def = mast.VarDef(type_name, identifier)
             root.add(var_def)
 
+            if reader.peek_token(skip_separators=False) == "[":
+                reader.read_token()
+                size = reader.read_token()
+                if not size.isdecimal() or int(size) not in range(1, 256):
+                    raise CompilerError(
+                        f"Expected array size {size!r} to be in range(1, 256)"
+                    )
+                var_def.size = int(size)
+
+                bracket = reader.read_token()
+                if bracket != "]":
+                    raise CompilerError(f"Expected {bracket!r} to be {']'!r}")
+
         # If the token is the literal 'print', the next token is read.
         # If the next token is alphabetical, it is treated as an identifier.
         # If the next token is numeric, it is treated as a literal.
@@ -125,6 +139,3 @@ def generate_mast(file: TextIO):
         # print(root)
 
     return root
-
-
-generate_mast(open("basic.lcom", "r"))
@@ -3,14 +3,20 @@
 from typing import NamedTuple
 from string import ascii_uppercase
 
+from exceptions import CompilerError
+
 
 class Var(NamedTuple):
     name: str
     type: str
     addr: int
+    # Number of elements of an array (at consecutive addresses from
+    # <addr>), or None for a single value
+    size: int | None = None
 
     def __repr__(self):
-        return f"Var({self.type} {self.name}: addr={self.addr_as_str})"
+        size = "" if self.size is None else f"[{self.size}]"
+        return f"Var({self.type} {self.name}{size}: addr={self.addr_as_str})"
 
     @property
     def addr_as_str(self):
@@ -18,29 +24,49 @@ class Var(NamedTuple):
 
 
 class Namespace:
+    """
+    The variables of one scope, with a reference to the enclosing scope's
+    namespace (if any). Names are looked up in this scope first, then in
+    the enclosing ones.
+
+    Occupied addresses are kept in a bitmap, in which bit <n> is set if
+    address <n> holds a variable visible from this scope.
+    """
+
     def __init__(self, parent: "Namespace" = None):
-        self.vars: list[Var] = []
-        if parent:
-            self.vars.extend(parent.vars)
+        self.parent = parent
+        self.vars: dict[str, Var] = {}
+        self.occupied = parent.occupied if parent else 0
+        # Every name looked up so far, so that enclosing scopes are only
+        # searched once per name
+        self._visible: dict[str, Var] = {}
 
     def __repr__(self):
-        return f"Namespace(vars={self.vars!r})"
+        return f"Namespace(vars={list(self.vars.values())!r}, parent={self.parent!r})"
 
     def __getitem__(self, name: str) -> Var:
         """
         Returns the Var object for the given variable name.
         """
-        for var in self.vars:
-            if var.name == name:
-                return var
+        if name in self._visible:
+            return self._visible[name]
 
-        raise KeyError(f"{name} is not in the namespace")
+        if self.parent is None:
+            raise KeyError(f"{name} is not in the namespace")
+
+        var = self._visible[name] = self.parent[name]
+        return var
 
     def __contains__(self, name: str) -> bool:
         """
         Returns whether or not the given name is in the namespace.
         """
-        return name in [v.name for v in self.vars]
+        try:
+            self[name]
+        except KeyError:
+            return False
+
+        return True
 
     @staticmethod
     def addr_as_str(addr: int) -> str:
@@ -64,37 +90,71 @@ class Namespace:
         Given an address, returns whether or not the address is
         currently occupied.
         """
-        for var in self.vars:
-            if var.addr == address:
-                return True
+        return bool(self.occupied >> address & 1)
 
-        return False
+    def free_bitmap(self, check_dist: int = 64) -> int:
+        """
+        Returns a bitmap of the free addresses below <check_dist>.
+        """
+        return ~self.occupied & ((1 << check_dist) - 1)
 
     def get_free_addresses(self, check_dist: int = 64) -> list[int]:
         """
-        Returns a list of string representations of free addresses.
+        Returns a list of the free addresses below <check_dist>.
         """
         free_addrs: list[int] = []
-        for i in range(check_dist):
-            if not self.address_occupied(i):
-                free_addrs.append(i)
+        free = self.free_bitmap(check_dist)
+        while free:
+            lowest = free & -free
+            free_addrs.append(lowest.bit_length() - 1)
+            free ^= lowest
 
         return free_addrs
 
     def get_free_address(self, check_dist: int = 64) -> int:
         """
-        Gets the next free address as a string.
+        Gets the lowest free address below <check_dist>.
         """
-        for i in range(check_dist):
-            if not self.address_occupied(i):
-                return i
+        free = self.free_bitmap(check_dist)
+        if not free:
+            raise CompilerError(f"No free address below {check_dist}")
+
+        return (free & -free).bit_length() - 1
 
-    def add_identifier(self, name: str, type: str) -> Var:
+    def get_free_block(self, size: int, check_dist: int = 64) -> int:
         """
-        Adds an identifier to the namespace, returning the Var
-        object created
+        Gets the lowest address starting <size> consecutive free addresses
+        below <check_dist>.
         """
-        addr = self.get_free_address()
-        var = Var(name, type, addr)
-        self.vars.append(var)
+        free = self.free_bitmap(check_dist)
+        # Bit <n> stays set if addresses <n> to <n + size - 1> are all free
+        starts = free
+        for offset in range(1, size):
+            starts &= free >> offset
+        if not starts:
+            raise CompilerError(
+                f"No {size} consecutive free addresses below {check_dist}"
+            )
+
+        return (starts & -starts).bit_length() - 1
+
+    def add_identifier(self, name: str, type: str, size: int | None = None) -> Var:
+        """
+        Adds an identifier to the namespace, returning the Var object bound
+        to the name. A name declared again in the same scope keeps
+        referring to its first declaration, and no address is taken for it;
+        the declarations must agree on the size.
+
+        If <size> is given, the variable is an array of that many values.
+        """
+        if name in self.vars:
+            if self.vars[name].size != size:
+                raise CompilerError(f"{name!r} is already declared with another size")
+            return self.vars[name]
+
+        length = 1 if size is None else size
+        addr = self.get_free_block(length)
+        self.occupied |= ((1 << length) - 1) << addr
+
+        var = self._visible[name] = self.vars[name] = Var(name, type, addr, size)
         return var
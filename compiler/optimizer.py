@@ -0,0 +1,330 @@
+# optimizer.py
+
+import operator
+
+import compiler.mast as mast
+from compiler.liveness import body_reads, expression_reads
+
+Component = mast.Identifier | mast.Literal | mast.Expression
+
+# Operators that can be evaluated at compile time. Results wrap around
+# modulo 256, like the machine's arithmetic.
+_FOLDABLE = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.floordiv,
+    "%": operator.mod,
+}
+
+
+def _literal_value(node: Component) -> int | None:
+    """
+    Returns the value of a literal node, or None if the node is not a
+    (decimal) literal. The value is reduced modulo 256, as the assembler
+    stores it.
+    """
+    if isinstance(node, mast.Literal) and str(node.value).isdecimal():
+        return int(node.value) % 256
+
+    return None
+
+
+def _is_pure(node: Component) -> bool:
+    """
+    Returns whether evaluating the node has no effect besides its value,
+    i.e. whether it contains no assignment.
+    """
+    if isinstance(node, mast.Expression):
+        return (
+            node.operator.value != "="
+            and _is_pure(node.left)
+            and _is_pure(node.right)
+        )
+
+    return True
+
+
+def fold_expression(expr: Component) -> Component:
+    """
+    Returns the expression with its literal subexpressions evaluated and
+    trivial identities (x + 0, x - 0, x * 1, x * 0, x - x, x / 1, x % 1)
+    simplified. The result may be a bare Literal or Identifier.
+    """
+    if not isinstance(expr, mast.Expression):
+        return expr
+
+    if expr.operator.value == "=":
+        # Only the assigned value can be simplified
+        return mast.Expression(expr.left, expr.operator, fold_expression(expr.right))
+
+    left = fold_expression(expr.left)
+    right = fold_expression(expr.right)
+    left_value = _literal_value(left)
+    right_value = _literal_value(right)
+
+    match expr.operator.value:
+        # Dividing by zero leaves the value unchanged at runtime (and sets
+        # the carry flag), so such divisions are left to the machine
+        case "/" | "%" if right_value == 0:
+            pass
+
+        case op if op in _FOLDABLE and None not in (left_value, right_value):
+            return mast.Literal(str(_FOLDABLE[op](left_value, right_value) % 256))
+
+        case "+" | "-" if right_value == 0:
+            return left
+
+        case "+" if left_value == 0:
+            return right
+
+        case "*" | "/" if right_value == 1:
+            return left
+
+        case "*" if left_value == 1:
+            return right
+
+        case "*" if 0 in (left_value, right_value) and _is_pure(expr):
+            return mast.Literal("0")
+
+        case "%" if right_value == 1 and _is_pure(expr):
+            return mast.Literal("0")
+
+        case "-" if (
+            isinstance(left, mast.Identifier)
+            and isinstance(right, mast.Identifier)
+            and left.value == right.value
+        ):
+            return mast.Literal("0")
+
+    return mast.Expression(left, expr.operator, right)
+
+
+def fold_constants(parent: mast.MAST):
+    """
+    Folds every expression statement in the MAST's body (and in the bodies
+    nested in it) in place. Statements that fold down to a bare value have
+    no effect and are removed.
+    """
+    body: list[mast.MAST] = []
+    for child in parent.body:
+        if isinstance(child, mast.Expression):
+            child = fold_expression(child)
+            if not isinstance(child, mast.Expression):
+                continue
+
+        elif child.has_body():
+            fold_constants(child)
+
+        body.append(child)
+
+    parent.body = body
+
+
+def _declare(declared: dict[str, int | None], child: mast.VarDef):
+    """
+    Records a declaration in <declared>, the sizes of the names declared in
+    one body. Like Namespace.add_identifier(), raises if the name was
+    already declared there with another size.
+    """
+    name = child.identifier.value
+    if declared.setdefault(name, child.size) != child.size:
+        raise mast.MASTError(f"{name!r} is already declared with another size")
+
+
+def _check_defined(names: set[str], scopes: list[dict[str, int | None]]):
+    """
+    Raises MASTError if a name in <names> is not declared in any of
+    <scopes>.
+    """
+    for name in sorted(names):
+        if not any(name in declared for declared in scopes):
+            raise mast.MASTError(f"Identifier {name!r} is not defined")
+
+
+def _size(name: str, scopes: list[dict[str, int | None]]) -> int | None:
+    """
+    Returns the size of the innermost declaration of <name> in <scopes>.
+    """
+    for declared in reversed(scopes):
+        if name in declared:
+            return declared[name]
+
+    return None
+
+
+def _check_array_use(
+    assignment: mast.Expression, scopes: list[dict[str, int | None]]
+):
+    """
+    Raises MASTError if the assignment uses an array the way compiling it
+    would reject: in an expression, or copied to a variable of another
+    size.
+    """
+    dest = assignment.left.value
+    match assignment.right:
+        case mast.Identifier(value=source) if _size(source, scopes) is not None:
+            if _size(source, scopes) != _size(dest, scopes):
+                raise mast.MASTError(f"Cannot copy array {source!r} to {dest!r}")
+
+        case value:
+            for name in expression_reads(value):
+                if _size(name, scopes) is not None:
+                    raise mast.MASTError(
+                        f"Array {name!r} cannot be used in an expression"
+                    )
+
+
+def _used_names(node: mast.MAST) -> set[str]:
+    """
+    Returns the names of every variable an expression or statement reads or
+    assigns.
+    """
+    match node:
+        case mast.Identifier():
+            return {node.value}
+
+        case mast.Expression() | mast.BinOp():
+            return _used_names(node.left) | _used_names(node.right)
+
+    return set()
+
+
+def _check_names(parent: mast.MAST, scopes: list[dict[str, int | None]]):
+    """
+    Raises MASTError if the MAST's body (or a body nested in it) uses a
+    variable before declaring it, as compiling it would. Code is checked
+    before it is removed, so that whether a program compiles does not
+    depend on the optimization level.
+    """
+    declared: dict[str, int | None] = {}
+    scopes.append(declared)
+    for child in parent.body:
+        match child:
+            case mast.VarDef():
+                _declare(declared, child)
+
+            case mast.Expression() | mast.BinOp():
+                _check_defined(_used_names(child), scopes)
+
+            case mast.If() | mast.While():
+                _check_defined(_used_names(child.condition), scopes)
+                _check_names(child, scopes)
+
+            case mast.Print():
+                _check_defined(_used_names(child.value), scopes)
+
+    scopes.pop()
+
+
+def _remove_dead_branches(parent: mast.MAST, scopes: list[dict[str, int | None]]):
+    """
+    Removes the if statements whose condition is the literal 0 from the
+    MAST's body (and the bodies nested in it). <scopes> holds the names
+    declared in each enclosing body, to check the removed code against.
+    """
+    declared: dict[str, int | None] = {}
+    scopes.append(declared)
+    body: list[mast.MAST] = []
+    for child in parent.body:
+        if isinstance(child, mast.VarDef):
+            _declare(declared, child)
+
+        if isinstance(child, mast.If) and _literal_value(child.condition) == 0:
+            _check_names(child, scopes)
+            continue
+
+        if isinstance(child, mast.FunctionDef):
+            # Functions do not see the enclosing names
+            _remove_dead_branches(child, [])
+        elif child.has_body():
+            _remove_dead_branches(child, scopes)
+        body.append(child)
+
+    scopes.pop()
+    parent.body = body
+
+
+def _remove_unread_variables(
+    parent: mast.MAST, unread: set[str], scopes: list[dict[str, int | None]]
+):
+    """
+    Removes the declarations of the variables in <unread> from the MAST's
+    body (and the bodies nested in it), along with every assignment to
+    them. <scopes> holds the names declared in each enclosing body, so that
+    the removed assignments still only use declared variables.
+    """
+    declared: dict[str, int | None] = {}
+    scopes.append(declared)
+    body: list[mast.MAST] = []
+    for child in parent.body:
+        match child:
+            case mast.VarDef():
+                _declare(declared, child)
+                if child.identifier.value in unread:
+                    continue
+
+            case mast.Expression(mast.Identifier(value=name), mast.Operator("=")):
+                if name in unread:
+                    _check_defined({name} | expression_reads(child), scopes)
+                    _check_array_use(child, scopes)
+                    continue
+
+            case mast.If() | mast.While():
+                _remove_unread_variables(child, unread, scopes)
+
+        body.append(child)
+
+    scopes.pop()
+    parent.body = body
+
+
+def _declared_names(parent: mast.MAST) -> set[str]:
+    names: set[str] = set()
+    for child in parent.body:
+        if isinstance(child, mast.VarDef):
+            names.add(child.identifier.value)
+        elif isinstance(child, (mast.If, mast.While)):
+            names |= _declared_names(child)
+
+    return names
+
+
+def eliminate_dead_code(root: mast.Root, level: int):
+    """
+    Removes code that can never run or has no effect from the MAST, in
+    place:
+
+    - if statements on the literal 0, at level 1 and above
+    - functions other than main, which nothing can call (the language has
+      no calls yet), at level 1 and above
+    - variables that are never read, with every assignment to them, at
+      level 2, where only the values a program outputs are kept
+    """
+    if level < 1:
+        return
+
+    _remove_dead_branches(root, [])
+    if any(
+        isinstance(child, mast.FunctionDef) and child.name == "main"
+        for child in root.body
+    ):
+        for child in root.body:
+            if isinstance(child, mast.FunctionDef) and child.name != "main":
+                _check_names(child, [])
+        root.body = [
+            child
+            for child in root.body
+            if not isinstance(child, mast.FunctionDef) or child.name == "main"
+        ]
+
+    if level < 2:
+        return
+
+    for function in [root] + [
+        child for child in root.body if isinstance(child, mast.FunctionDef)
+    ]:
+        # Removing an assignment can leave more variables unread
+        while unread := _declared_names(function) - body_reads(function):
+            _remove_unread_variables(function, unread, [])
+
@@ -0,0 +1,261 @@
+# peephole.py
+
+from compiler._constants import DEFAULT_OPT_LEVEL
+from compiler.instructions import Instr, Item, Label, size_of
+
+# Index of the jump target operand of each jump with a constant target.
+# (JMP jumps to an address held in memory, so it is never rewritten.)
+_JUMP_TARGETS = {
+    "JMPC": 0,
+    "JZ": 1,
+    "JNZ": 1,
+    "JPOS": 1,
+    "JNEG": 1,
+    "JCARRY": 0,
+    "JNCARRY": 0,
+}
+
+# Instructions after which execution never falls through
+_TERMINATORS = ("END", "JMPC")
+
+# Instructions that write their first operand and have no other effect
+_PURE_STORES = ("SET", "MOV", "MUL", "MULC")
+
+
+class Report:
+    """
+    What the peephole optimizer did to a program: the bytes it saved, the
+    instructions it removed (each one a cycle saved every time the code
+    around it runs) and the number of times each rule applied.
+    """
+
+    def __init__(self):
+        self.bytes_saved = 0
+        self.instructions_removed = 0
+        self.rewrites: dict[str, int] = {}
+
+    def __repr__(self):
+        return (
+            f"Report(bytes_saved={self.bytes_saved}, "
+            f"instructions_removed={self.instructions_removed}, "
+            f"rewrites={self.rewrites!r})"
+        )
+
+
+def _remove_self_moves(items: list[Item]) -> tuple[list[Item], int]:
+    """
+    MOV a a
+    """
+    output = [
+        item
+        for item in items
+        if not (
+            isinstance(item, Instr)
+            and item.op == "MOV"
+            and item.operands[0] == item.operands[1]
+        )
+    ]
+    return output, len(items) - len(output)
+
+
+def _use_inc_dec(items: list[Item]) -> tuple[list[Item], int]:
+    """
+    ADDC x 1 -> INC x
+    SUBC x 1 -> DEC x
+    """
+    output: list[Item] = []
+    count = 0
+    for item in items:
+        match item:
+            case Instr("ADDC" | "SUBC" as op, (dest, const)) if str(const) == "1":
+                item = Instr("INC" if op == "ADDC" else "DEC", (dest,))
+                count += 1
+
+        output.append(item)
+
+    return output, count
+
+
+def _remove_redundant_stores(items: list[Item]) -> tuple[list[Item], int]:
+    """
+    SET/MOV/MUL x ...; SET/MOV x y  -> SET/MOV x y   (unless y is x)
+    MOV x y; MOV y x                -> MOV x y
+    """
+    output: list[Item] = []
+    count = 0
+    # Index in output of the previous instruction, if nothing can jump
+    # between it and the current one
+    previous: int | None = None
+    for item in items:
+        match item:
+            case Label():
+                previous = None
+
+            case Instr("SET" | "MOV", (dest, *source)) if previous is not None:
+                prev = output[previous]
+                if prev.op == "MOV" and prev.operands == (source[0], dest):
+                    count += 1
+                    continue
+
+                if (
+                    prev.op in _PURE_STORES
+                    and prev.operands[0] == dest
+                    and (item.op == "SET" or source[0] != dest)
+                ):
+                    del output[previous]
+                    count += 1
+
+        output.append(item)
+        if isinstance(item, Instr):
+            previous = len(output) - 1
+
+    return output, count
+
+
+def _next_instrs(items: list[Item]) -> list[int]:
+    """
+    Returns the index of the first instruction at or after each index of
+    the items (len(items) if there is none).
+    """
+    next_instrs = [len(items)] * (len(items) + 1)
+    for index in reversed(range(len(items))):
+        if isinstance(items[index], Instr):
+            next_instrs[index] = index
+        else:
+            next_instrs[index] = next_instrs[index + 1]
+
+    return next_instrs
+
+
+def _thread_jumps(items: list[Item]) -> tuple[list[Item], int]:
+    """
+    JZ x L; ...; L: JMPC M  -> JZ x M
+    JMPC L; L:              -> (nothing)
+    """
+    next_instrs = _next_instrs(items)
+    # Index of the instruction each label stands for
+    label_instrs = {
+        item: next_instrs[index]
+        for index, item in enumerate(items)
+        if isinstance(item, Label)
+    }
+
+    output: list[Item] = []
+    count = 0
+    for index, item in enumerate(items):
+        if not (isinstance(item, Instr) and item.op in _JUMP_TARGETS):
+            output.append(item)
+            continue
+
+        operand = _JUMP_TARGETS[item.op]
+        target = item.operands[operand]
+        seen = {target}
+        while isinstance(target, Label) and label_instrs[target] < len(items):
+            match items[label_instrs[target]]:
+                case Instr("JMPC", (next_target,)):
+                    target = next_target
+                case _:
+                    break
+
+            if target in seen:
+                # The jumps form a loop, so leave it alone
+                target = item.operands[operand]
+                break
+            seen.add(target)
+
+        if target is not item.operands[operand]:
+            operands = list(item.operands)
+            operands[operand] = target
+            item = Instr(item.op, tuple(operands))
+            count += 1
+
+        # A jump to the very next instruction does nothing
+        if (
+            isinstance(target, Label)
+            and label_instrs[target] == next_instrs[index + 1]
+        ):
+            count += 1
+            continue
+
+        output.append(item)
+
+    return output, count
+
+
+def _remove_unreachable(items: list[Item]) -> tuple[list[Item], int]:
+    """
+    END/JMPC ...; <code>; L:  -> END/JMPC ...; L:
+    where nothing jumps into <code>. Named labels are kept as entry points,
+    and unused anonymous labels are removed.
+    """
+    targets = {
+        operand
+        for item in items
+        if isinstance(item, Instr)
+        for operand in item.operands
+        if isinstance(operand, Label)
+    }
+
+    output: list[Item] = []
+    count = 0
+    reachable = True
+    for item in items:
+        match item:
+            case Label(name=None) if item not in targets:
+                continue
+
+            case Label():
+                reachable = True
+
+            case _ if not reachable:
+                count += isinstance(item, Instr)
+                continue
+
+            case Instr(op) if op in _TERMINATORS:
+                reachable = False
+
+        output.append(item)
+
+    return output, count
+
+
+# Rules applied at each optimization level and above
+_RULES = [
+    (1, _remove_self_moves),
+    (1, _use_inc_dec),
+    (1, _remove_redundant_stores),
+    (1, _thread_jumps),
+    (1, _remove_unreachable),
+]
+
+
+def optimize(
+    items: list[Item], level: int = DEFAULT_OPT_LEVEL, report: Report | None = None
+) -> list[Item]:
+    """
+    Returns the items with the peephole rules of the given optimization
+    level (0 for none) applied until none of them changes anything. If
+    <report> is given, what was changed is added to it.
+    """
+    size = size_of(items)
+    instr_count = sum(isinstance(item, Instr) for item in items)
+
+    rules = [rule for rule_level, rule in _RULES if level >= rule_level]
+    changed = True
+    while changed:
+        changed = False
+        for rule in rules:
+            items, count = rule(items)
+            if count and report is not None:
+                name = rule.__name__.lstrip("_")
+                report.rewrites[name] = report.rewrites.get(name, 0) + count
+            changed = changed or bool(count)
+
+    if report is not None:
+        report.bytes_saved += size - size_of(items)
+        report.instructions_removed += instr_count - sum(
+            isinstance(item, Instr) for item in items
+        )
+
+    return items
+
@@ -1,103 +1,158 @@
 # reader.py
 
-from io import BytesIO
+import mmap
+import re
+from pathlib import Path
 from pprint import pprint
-from typing import Iterator, TextIO
+from itertools import islice
+from typing import Iterable, Iterator
 from compiler._constants import SYMBOL_CHARS, LONG_SYMBOLS, SEPARATORS
 from exceptions import EndOfFile
 
 
-class Reader:
-    def __init__(self, file: TextIO):
-        self.file = file
-        full_text = file.read()
-        self.tokens: list[str] = []
+class Token(str):
+    """
+    A token, with the (1-based) line and column it starts at.
+    """
+
+    __slots__ = ("line", "column")
+
+    def __new__(cls, value: str, line: int = 0, column: int = 0):
+        token = super().__new__(cls, value)
+        token.line = line
+        token.column = column
+        return token
+
+    @property
+    def position(self) -> str:
+        return f"line {self.line}, column {self.column}"
+
+
+# Matches the next token, skipping the whitespace before it. A comment runs
+# from '#' up to (but not including) the next separator, and long symbols
+# are tried before single characters. The second group catches any other
+# (illegal) character.
+_TOKEN_RE = re.compile(
+    rf"[^\S{re.escape(SEPARATORS)}]*(?:("
+    + "|".join(
+        [
+            r"[^\W\d_]+",
+            r"\d+",
+            f"[{re.escape(SEPARATORS)}]",
+            *(re.escape(s) for s in sorted(LONG_SYMBOLS, key=len, reverse=True)),
+            f"[{re.escape(SYMBOL_CHARS.replace('#', ''))}]",
+            rf"\#[^{re.escape(SEPARATORS)}]*",
+        ]
+    )
+    + r")|(\S))"
+)
+
+# Number of lines tokenized at a time
+_CHUNK_LINES = 256
+
+
+def tokenize(lines: Iterable[str]) -> Iterator[list[Token]]:
+    """
+    Lazily splits source code, given as an iterable of lines (such as an
+    open file), into tokens. The tokens are produced in lists, one per
+    chunk of _CHUNK_LINES lines, so only one chunk of the source is held
+    in memory at a time.
+    """
+    lines = iter(lines)
+    line_number = 1
+    new_token = str.__new__
+    while chunk := "".join(islice(lines, _CHUNK_LINES)):
+        tokens: list[Token] = []
+        append = tokens.append
+        line_start = 0
+        for match in _TOKEN_RE.finditer(chunk):
+            value = match[1]
+            if value is None:
+                column = match.start(2) - line_start + 1
+                raise SyntaxError(
+                    f"Illegal character: {match[2]!r} "
+                    f"(line {line_number}, column {column})"
+                )
+
+            start = match.start(1)
+            token = new_token(Token, value)
+            token.line = line_number
+            token.column = start - line_start + 1
+            append(token)
+
+            if value == "\n":
+                line_number += 1
+                line_start = start + 1
+
+        yield tokens
+
+
+def _mapped_lines(path: Path | str) -> Iterator[str]:
+    with open(path, "rb") as file:
+        if not file.seek(0, 2):
+            # mmap() refuses empty files
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode()
 
-        token = ""
-        for char in full_text:
-            if token and (token[0] == "#") and (char not in SEPARATORS):
-                token += char
-                continue
 
-            match char:
-                case char if char.isalpha():
-                    # If the token is empty or the token is alphabetical,
-                    # 	append char to the token.
-                    # Otherwise, start a new token with char.
-                    if (not token) or token.isalpha():
-                        token += char
-                    else:
-                        self.tokens.append(token)
-                        token = char
-
-                case char if (char in SEPARATORS):
-                    # If the token is 0 or more line separators, append char
-                    # 	to the token. Otherwise, start a new token with char.
-                    if token:
-                        self.tokens.append(token)
-                        token = ""
-                    self.tokens.append(char)
-
-                case char if char.isspace():
-                    # If the token is not empty, append it to the list
-                    # 	and start a new empty token.
-                    if token:
-                        self.tokens.append(token)
-                        token = ""
-
-                case char if char.isnumeric():
-                    # If the token is empty or the token
-                    # 	is numeric, append char to the token.
-                    # Otherwise, start a new token with char.
-                    if (not token) or token.isnumeric():
-                        token += char
-                    else:
-                        self.tokens.append(token)
-                        token = char
-
-                case char if (char in SYMBOL_CHARS):
-                    # If the token is empty, add the char to the token.
-                    # If the current token + the char is a long symbol,
-                    # 	add the char to the token.
-                    # Otherwise, add the current token to the tokens list
-                    # 	and start a new token with char.
-                    if not token:
-                        token += char
-                    elif (token + char) in LONG_SYMBOLS:
-                        token += char
-                    else:
-                        self.tokens.append(token)
-                        token = char
-
-                case default:
-                    raise SyntaxError(f"Illegal character: {default!r}")
-
-        if token:
-            self.tokens.append(token)
+class Reader:
+    """
+    Reads tokens from source code, given as an iterable of lines (such as
+    an open file), with lookahead. Tokens are produced on demand.
+    """
 
+    def __init__(self, file: Iterable[str]):
+        self.file = file
+        self._chunks = tokenize(file)
+        # Tokens read from the source but not consumed yet start at
+        # self.index
+        self.tokens: list[Token] = []
         self.index = 0
 
-    def read_token(self, skip_separators=True) -> str:
-        try:
-            while skip_separators and (self.tokens[self.index] in SEPARATORS):
-                self.index += 1
-            self.index += 1
-            return self.tokens[self.index - 1]
+    @classmethod
+    def from_path(cls, path: Path | str) -> "Reader":
+        """
+        Returns a reader for the source file at <path>, which is
+        memory-mapped rather than read.
+        """
+        return cls(_mapped_lines(path))
+
+    def _peek_index(self, skip_separators: bool) -> int:
+        """
+        Returns the index in self.tokens of the next token, tokenizing
+        more of the source as needed.
+        """
+        index = self.index
+        while True:
+            if index == len(self.tokens):
+                # Drop the consumed tokens and tokenize the next chunk
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    raise EndOfFile()
+
+                del self.tokens[: self.index]
+                index -= self.index
+                self.index = 0
+                self.tokens.extend(chunk)
+                continue
+
+            if not (skip_separators and self.tokens[index] in SEPARATORS):
+                return index
 
-        except IndexError:
-            raise EndOfFile()
+            index += 1
 
-    def peek_token(self, skip_separators=True) -> str:
-        peek_index = self.index
-        try:
-            while skip_separators and (self.tokens[peek_index] in SEPARATORS):
-                peek_index += 1
-            return self.tokens[peek_index]
+    def read_token(self, skip_separators=True) -> Token:
+        index = self._peek_index(skip_separators)
+        self.index = index + 1
+        return self.tokens[index]
 
-        except IndexError:
-            raise EndOfFile()
+    def peek_token(self, skip_separators=True) -> Token:
+        return self.tokens[self._peek_index(skip_separators)]
 
-    def read_until_separator(self) -> list[str]:
+    def read_until_separator(self) -> list[Token]:
         tokens = []
         while self.peek_token(skip_separators=False) not in SEPARATORS:
             tokens.append(self.read_token())
@@ -106,6 +161,5 @@ class Reader:
 
 
 if __name__ == "__main__":
-    with open("basic.lcom", "r") as file:
-        reader = Reader(file)
-        pprint(reader.tokens)
+    for tokens in tokenize(open("basic.lcom", "r")):
+        pprint(tokens)
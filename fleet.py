@@ -0,0 +1,189 @@
+# fleet.py
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import compiler
+import assembler
+from build_cache import BuildCache
+from ports import Machine
+
+from _constants import FILE_EXT
+
+DEFAULT_MAX_CYCLES = 0x10000
+DEFAULT_CHUNKSIZE = 16
+
+
+class Job(NamedTuple):
+    """
+    A program to execute once, with the values fed to its IN instructions.
+    """
+
+    program: Path
+    inputs: tuple[int, ...] = ()
+    max_cycles: int = DEFAULT_MAX_CYCLES
+
+
+class JobResult(NamedTuple):
+    job: Job
+    # "halted" if the program reached END, "timeout" if it ran out of
+    # cycles, "error" if it could not be built or executed.
+    status: str
+    cycles: int = 0
+    outputs: tuple[int, ...] = ()
+    state: bytes = b""
+    error: str = ""
+
+
+def build(program: Path) -> bytearray:
+    """
+    Returns the bytecode of a .lcom or .lasm program.
+    """
+    if program.suffix == f".{FILE_EXT.COMPILABLE.value}":
+        return compiler.compile_source(program.read_text())
+
+    with open(program, "r") as lasm:
+        return assembler.masm_to_bytecode(lasm)
+
+
+def execute(state: bytearray, job: Job) -> JobResult:
+    """
+    Runs <state> until it reaches END or <job.max_cycles>, feeding
+    <job.inputs> to successive IN instructions (and 0 once exhausted) and
+    collecting the values written by OUT and OUTC.
+    """
+    machine = Machine(state, job.inputs)
+    outputs = tuple(machine.outputs(job.max_cycles))
+    status = "halted" if machine.halted else "timeout"
+    return JobResult(job, status, machine.cycles, outputs, bytes(state))
+
+
+def _run_chunk(jobs: list[Job]) -> list[JobResult]:
+    """
+    Worker entry point: builds and executes a chunk of jobs, building each
+    program only once (and not at all if it is in the build cache).
+    """
+    cache = BuildCache()
+    images: dict[Path, bytearray | Exception] = {}
+    results: list[JobResult] = []
+    for job in jobs:
+        if job.program not in images:
+            try:
+                images[job.program] = cache.build(job.program)
+            except Exception as e:
+                images[job.program] = e
+
+        image = images[job.program]
+        if isinstance(image, Exception):
+            results.append(JobResult(job, "error", error=f"{image!r}"))
+            continue
+
+        try:
+            results.append(execute(bytearray(image), job))
+        except Exception as e:
+            results.append(JobResult(job, "error", error=f"{e!r}"))
+
+    return results
+
+
+def run_fleet(
+    jobs: list[Job],
+    workers: int | None = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[JobResult]:
+    """
+    Builds and executes <jobs> across a pool of <workers> processes
+    (defaulting to one per core), yielding results as each chunk of
+    <chunksize> jobs completes. Results are therefore not in job order.
+
+    Jobs are grouped by program before being chunked, so a program is
+    usually built once per chunk rather than once per job.
+    """
+    jobs = sorted(jobs, key=lambda job: str(job.program))
+    chunks = [jobs[i : i + chunksize] for i in range(0, len(jobs), chunksize)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def find_programs(directory: Path) -> list[Path]:
+    """
+    Returns every .lcom and .lasm program in <directory>.
+    """
+    extensions = (FILE_EXT.COMPILABLE.value, FILE_EXT.ASSEMBLY.value)
+    return sorted(
+        path for ext in extensions for path in Path(directory).glob(f"*.{ext}")
+    )
+
+
+def load_manifest(manifest_path: Path) -> list[Job]:
+    """
+    Loads jobs from a JSON manifest of the form
+
+        [
+            {"program": "add.lcom", "inputs": [[1, 2], [3, 4]], "max_cycles": 500},
+            {"program": "loop.lasm"}
+        ]
+
+    where every input vector becomes one job. Program paths are relative to
+    the manifest. "inputs" defaults to a single empty vector and
+    "max_cycles" to DEFAULT_MAX_CYCLES.
+    """
+    with open(manifest_path, "r") as file:
+        entries = json.load(file)
+
+    jobs: list[Job] = []
+    for entry in entries:
+        program = Path(manifest_path).parent / entry["program"]
+        max_cycles = entry.get("max_cycles", DEFAULT_MAX_CYCLES)
+        for inputs in entry.get("inputs", [[]]):
+            jobs.append(Job(program, tuple(inputs), max_cycles))
+
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile, assemble and run many Lens programs in parallel."
+    )
+    parser.add_argument(
+        "path", type=Path, help="directory of programs or a JSON manifest"
+    )
+    parser.add_argument(
+        "-i",
+        "--inputs",
+        action="append",
+        help="input vector for directory runs, e.g. '1 2 3' (repeatable)",
+    )
+    parser.add_argument("-c", "--max-cycles", type=int, default=DEFAULT_MAX_CYCLES)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    if args.path.is_dir():
+        vectors = [tuple(int(i) for i in v.split()) for v in args.inputs or [""]]
+        jobs = [
+            Job(program, inputs, args.max_cycles)
+            for program in find_programs(args.path)
+            for inputs in vectors
+        ]
+    else:
+        jobs = load_manifest(args.path)
+
+    for result in run_fleet(jobs, args.workers, args.chunksize):
+        job = result.job
+        line = f"{str(job.program):<40} {list(job.inputs)!s:<16} {result.status:<8}"
+        if result.status == "error":
+            print(f"{line} {result.error}")
+        else:
+            print(f"{line} cycles={result.cycles} outputs={list(result.outputs)}")
+
+
+if __name__ == "__main__":
+    main()
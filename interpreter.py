@@ -1,6 +1,10 @@
 # interpreter.py
 
-from assembler import LOCATION, INSTR
+import functools
+from enum import Enum
+from typing import NamedTuple
+
+from assembler import LOCATION, INSTR, INSTR_OPERANDS
 from exceptions import InterpreterError
 
 
@@ -27,6 +31,47 @@ def add(state: bytearray, addr: int, value: int, set_flag: bool = True):
     state[addr] = res % 256
 
 
+def divide(state: bytearray, addr: int, value: int, remainder: bool = False):
+    """
+    Divides the value at <addr> by <value> (or takes the remainder of the
+    division). Dividing by zero sets the carry flag and leaves <addr>
+    unchanged; otherwise the carry flag is cleared.
+    """
+    if value == 0:
+        state[LOCATION.FLAG_CARRY] = True
+        return
+
+    res = state[addr] % value if remainder else state[addr] // value
+    state[LOCATION.FLAG_CARRY] = False
+    state[addr] = res
+
+
+def read_block(state: bytearray, addr: int, count: int) -> bytearray:
+    """
+    Returns the <count> bytes starting at <addr>, wrapping around from 0xFF
+    to 0x00.
+    """
+    end = addr + count
+    if end <= 256:
+        return state[addr:end]
+
+    return state[addr:] + state[: end - 256]
+
+
+def write_block(state: bytearray, addr: int, data: bytes):
+    """
+    Writes <data> starting at <addr>, wrapping around from 0xFF to 0x00.
+    """
+    end = addr + len(data)
+    if end <= 256:
+        state[addr:end] = data
+        return
+
+    split = 256 - addr
+    state[addr:] = data[:split]
+    state[: end - 256] = data[split:]
+
+
 def heapflags(state: bytearray) -> list[bool]:
     flag_bytes = state[LOCATION.HEAPFLAG_START : LOCATION.HEAPFLAG_END + 1]
     flags_as_int = int.from_bytes(flag_bytes, byteorder="big")
@@ -93,6 +138,25 @@ def cycle(state: bytearray) -> int:
             addr2 = read_rel(state)
             state[addr1], state[addr2] = state[addr2], state[addr1]
 
+        # MEMSET <dest> <value> <count>
+        # Sets the <count> bytes from relative address <dest> onwards to
+        # <value>, wrapping around from 0xFF to 0x00.
+        case INSTR.MEMSET:
+            dest = read_rel(state)
+            value = read(state)
+            count = read(state)
+            write_block(state, dest, bytes((value,)) * count)
+
+        # MEMCPY <dest> <src> <count>
+        # Copies the <count> bytes from relative address <src> onwards to
+        # relative address <dest> onwards, wrapping around from 0xFF to
+        # 0x00. Overlapping regions are copied as if through a buffer.
+        case INSTR.MEMCPY:
+            dest = read_rel(state)
+            src = read_rel(state)
+            count = read(state)
+            write_block(state, dest, read_block(state, src, count))
+
         # JMP <addr>
         # Sets the instruction pointer to the
         # (absolute) address at <addr>.
@@ -168,6 +232,32 @@ def cycle(state: bytearray) -> int:
             src_const = read(state)
             state[dest] = (state[dest] * src_const) % 256
 
+        # DIV <dest> <src>
+        # Divides relative address <dest> by the value at relative address
+        # <src>, rounding down. Dividing by zero sets the carry flag and
+        # leaves <dest> unchanged; otherwise the carry flag is cleared.
+        case INSTR.DIV:
+            dest = read_rel(state)
+            src = read_rel(state)
+            divide(state, dest, state[src])
+
+        case INSTR.DIVC:
+            dest = read_rel(state)
+            src_const = read(state)
+            divide(state, dest, src_const)
+
+        # MOD <dest> <src>
+        # Like DIV, but stores the remainder of the division
+        case INSTR.MOD:
+            dest = read_rel(state)
+            src = read_rel(state)
+            divide(state, dest, state[src], remainder=True)
+
+        case INSTR.MODC:
+            dest = read_rel(state)
+            src_const = read(state)
+            divide(state, dest, src_const, remainder=True)
+
         case INSTR.INC:
             addr = read_rel(state)
             add(state, addr, 1)
@@ -192,3 +282,1570 @@ def cycle(state: bytearray) -> int:
             raise InterpreterError(f"Unknown instruction: {instr}")
 
     return state[LOCATION.OUTPUT]
+
+
+def memory_access(state: bytearray) -> tuple[list[int], list[int]]:
+    """
+    Returns the addresses read and written by the instruction at the
+    instruction pointer, in the order cycle() accesses them.
+
+    The instruction's own bytes are not included, and neither are the
+    instruction pointer, clock and output bytes that every cycle updates.
+    """
+    ip = state[LOCATION.INSTR_PTR]
+    stack_ptr = state[LOCATION.STACK_PTR]
+
+    def operand_rel(index: int) -> int:
+        return (state[ip + index] + stack_ptr) % 256
+
+    match state[ip]:
+        case INSTR.SET:
+            return [], [operand_rel(1)]
+
+        case INSTR.MOV:
+            return [operand_rel(2)], [operand_rel(1)]
+
+        case INSTR.SEND:
+            src, offset_addr = operand_rel(1), operand_rel(2)
+            return [src, offset_addr], [(src + state[offset_addr]) % 256]
+
+        case INSTR.STACK:
+            return [LOCATION.STACK_PTR], [LOCATION.STACK_PTR]
+
+        case INSTR.SWAP:
+            addrs = [operand_rel(1), operand_rel(2)]
+            return addrs, addrs
+
+        case INSTR.MEMSET:
+            dest, count = operand_rel(1), state[ip + 3]
+            return [], [(dest + offset) % 256 for offset in range(count)]
+
+        case INSTR.MEMCPY:
+            dest, src, count = operand_rel(1), operand_rel(2), state[ip + 3]
+            return (
+                [(src + offset) % 256 for offset in range(count)],
+                [(dest + offset) % 256 for offset in range(count)],
+            )
+
+        case (INSTR.JMP | INSTR.JZ | INSTR.JNZ | INSTR.JPOS | INSTR.JNEG):
+            return [operand_rel(1)], []
+
+        case (INSTR.JCARRY | INSTR.JNCARRY):
+            return [LOCATION.FLAG_CARRY], []
+
+        case (INSTR.ADD | INSTR.SUB):
+            dest, src = operand_rel(1), operand_rel(2)
+            return [dest, src], [LOCATION.FLAG_CARRY, dest]
+
+        case (INSTR.ADDC | INSTR.SUBC):
+            dest = operand_rel(1)
+            return [dest], [LOCATION.FLAG_CARRY, dest]
+
+        case INSTR.MUL:
+            dest, src = operand_rel(1), operand_rel(2)
+            return [dest, src], [dest]
+
+        case INSTR.MULC:
+            dest = operand_rel(1)
+            return [dest], [dest]
+
+        case (INSTR.DIV | INSTR.MOD):
+            dest, src = operand_rel(1), operand_rel(2)
+            return [dest, src], [LOCATION.FLAG_CARRY, dest]
+
+        case (INSTR.DIVC | INSTR.MODC):
+            dest = operand_rel(1)
+            return [dest], [LOCATION.FLAG_CARRY, dest]
+
+        case (INSTR.INC | INSTR.DEC):
+            addr = operand_rel(1)
+            return [addr], [LOCATION.FLAG_CARRY, addr]
+
+        case INSTR.IN:
+            return [LOCATION.INPUT], [operand_rel(1)]
+
+        case INSTR.OUT:
+            return [operand_rel(1)], [LOCATION.OUTPUT]
+
+        case INSTR.OUTC:
+            return [], [LOCATION.OUTPUT]
+
+    return [], []
+
+
+# Plain ints for the header locations and opcodes used inside the hot loop;
+# IntEnum attribute lookups are comparatively slow.
+_IP = int(LOCATION.INSTR_PTR)
+_SP = int(LOCATION.STACK_PTR)
+_CARRY = int(LOCATION.FLAG_CARRY)
+_INPUT = int(LOCATION.INPUT)
+_OUTPUT = int(LOCATION.OUTPUT)
+_END = int(INSTR.END)
+
+# Operand addresses below this bound (instruction pointer, stack pointer,
+# carry flag, clock, input and output) are not handled by the fast
+# handlers; see _SLOW below.
+_SPECIAL_END = int(LOCATION.OUTPUT) + 1
+
+# Returned by a handler, instead of the next instruction pointer, when the
+# instruction has to be executed by cycle() itself: it touches the header
+# bytes or jumps into them. Handlers return it *before* touching the state.
+_SLOW = -1
+
+
+def _advance_clock(state: bytearray, cycles: int):
+    """
+    Adds <cycles> to the clock bytes, wrapping around like cycle() does.
+    """
+    clock_slice = slice(LOCATION.CLOCK_START, LOCATION.CLOCK_END + 1)
+    clock = int.from_bytes(state[clock_slice], byteorder="big") + cycles
+    state[clock_slice] = (clock % 2**32).to_bytes(4, byteorder="big")
+
+
+# Instruction handlers for run(). Each handler receives the state and the
+# current instruction and stack pointers, executes the instruction at
+# <ip> and returns the address of the next instruction (or _SLOW).
+
+
+def _op_nop(state: bytearray, ip: int, sp: int) -> int:
+    return ip + 1
+
+
+def _op_end(state: bytearray, ip: int, sp: int) -> int:
+    return ip
+
+
+def _op_set(state: bytearray, ip: int, sp: int) -> int:
+    addr = (state[ip + 1] + sp) % 256
+    if addr < _SPECIAL_END:
+        return _SLOW
+    state[addr] = state[ip + 2]
+    return ip + 3
+
+
+def _op_mov(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    if dest < _SPECIAL_END or src < _SPECIAL_END:
+        return _SLOW
+    state[dest] = state[src]
+    return ip + 3
+
+
+def _op_send(state: bytearray, ip: int, sp: int) -> int:
+    src = (state[ip + 1] + sp) % 256
+    offset_addr = (state[ip + 2] + sp) % 256
+    if src < _SPECIAL_END or offset_addr < _SPECIAL_END:
+        return _SLOW
+    dest = (src + state[offset_addr]) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    state[dest] = state[src]
+    return ip + 3
+
+
+def _op_stack(state: bytearray, ip: int, sp: int) -> int:
+    # Changes the stack pointer, which run() keeps in a local.
+    return _SLOW
+
+
+def _op_swap(state: bytearray, ip: int, sp: int) -> int:
+    addr1 = (state[ip + 1] + sp) % 256
+    addr2 = (state[ip + 2] + sp) % 256
+    if addr1 < _SPECIAL_END or addr2 < _SPECIAL_END:
+        return _SLOW
+    state[addr1], state[addr2] = state[addr2], state[addr1]
+    return ip + 3
+
+
+def _op_memset(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    end = dest + state[ip + 3]
+    if dest < _SPECIAL_END or end > 256:
+        return _SLOW
+    state[dest:end] = bytes((state[ip + 2],)) * (end - dest)
+    return ip + 4
+
+
+def _op_memcpy(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    count = state[ip + 3]
+    if (
+        dest < _SPECIAL_END
+        or src < _SPECIAL_END
+        or dest + count > 256
+        or src + count > 256
+    ):
+        return _SLOW
+    state[dest : dest + count] = state[src : src + count]
+    return ip + 4
+
+
+def _op_jmp(state: bytearray, ip: int, sp: int) -> int:
+    addr = (state[ip + 1] + sp) % 256
+    if addr < _SPECIAL_END or state[addr] < _SPECIAL_END:
+        return _SLOW
+    return state[addr]
+
+
+def _op_jmpc(state: bytearray, ip: int, sp: int) -> int:
+    dest = state[ip + 1]
+    if dest < _SPECIAL_END:
+        return _SLOW
+    return dest
+
+
+def _op_jz(state: bytearray, ip: int, sp: int) -> int:
+    condition = (state[ip + 1] + sp) % 256
+    dest = state[ip + 2]
+    if condition < _SPECIAL_END or dest < _SPECIAL_END:
+        return _SLOW
+    return dest if state[condition] == 0 else ip + 3
+
+
+def _op_jnz(state: bytearray, ip: int, sp: int) -> int:
+    condition = (state[ip + 1] + sp) % 256
+    dest = state[ip + 2]
+    if condition < _SPECIAL_END or dest < _SPECIAL_END:
+        return _SLOW
+    return dest if state[condition] != 0 else ip + 3
+
+
+def _op_jpos(state: bytearray, ip: int, sp: int) -> int:
+    condition = (state[ip + 1] + sp) % 256
+    dest = state[ip + 2]
+    if condition < _SPECIAL_END or dest < _SPECIAL_END:
+        return _SLOW
+    return dest if 0x01 <= state[condition] < 0x7F else ip + 3
+
+
+def _op_jneg(state: bytearray, ip: int, sp: int) -> int:
+    condition = (state[ip + 1] + sp) % 256
+    dest = state[ip + 2]
+    if condition < _SPECIAL_END or dest < _SPECIAL_END:
+        return _SLOW
+    return dest if 0x80 <= state[condition] < 0xFF else ip + 3
+
+
+def _op_jcarry(state: bytearray, ip: int, sp: int) -> int:
+    dest = state[ip + 1]
+    if dest < _SPECIAL_END:
+        return _SLOW
+    return dest if state[_CARRY] else ip + 2
+
+
+def _op_jncarry(state: bytearray, ip: int, sp: int) -> int:
+    dest = state[ip + 1]
+    if dest < _SPECIAL_END:
+        return _SLOW
+    return dest if not state[_CARRY] else ip + 2
+
+
+def _op_add(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    if dest < _SPECIAL_END or src < _SPECIAL_END:
+        return _SLOW
+    res = state[dest] + state[src]
+    state[_CARRY] = res > 0xFF
+    state[dest] = res % 256
+    return ip + 3
+
+
+def _op_addc(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    res = state[dest] + state[ip + 2]
+    state[_CARRY] = res > 0xFF
+    state[dest] = res % 256
+    return ip + 3
+
+
+def _op_sub(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    if dest < _SPECIAL_END or src < _SPECIAL_END:
+        return _SLOW
+    res = state[dest] - state[src]
+    state[_CARRY] = res < 0
+    state[dest] = res % 256
+    return ip + 3
+
+
+def _op_subc(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    res = state[dest] - state[ip + 2]
+    state[_CARRY] = res < 0
+    state[dest] = res % 256
+    return ip + 3
+
+
+def _op_mul(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    if dest < _SPECIAL_END or src < _SPECIAL_END:
+        return _SLOW
+    state[dest] = (state[dest] * state[src]) % 256
+    return ip + 3
+
+
+def _op_mulc(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    state[dest] = (state[dest] * state[ip + 2]) % 256
+    return ip + 3
+
+
+def _op_div(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    if dest < _SPECIAL_END or src < _SPECIAL_END:
+        return _SLOW
+    divisor = state[src]
+    state[_CARRY] = divisor == 0
+    if divisor:
+        state[dest] //= divisor
+    return ip + 3
+
+
+def _op_divc(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    divisor = state[ip + 2]
+    state[_CARRY] = divisor == 0
+    if divisor:
+        state[dest] //= divisor
+    return ip + 3
+
+
+def _op_mod(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    src = (state[ip + 2] + sp) % 256
+    if dest < _SPECIAL_END or src < _SPECIAL_END:
+        return _SLOW
+    divisor = state[src]
+    state[_CARRY] = divisor == 0
+    if divisor:
+        state[dest] %= divisor
+    return ip + 3
+
+
+def _op_modc(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    divisor = state[ip + 2]
+    state[_CARRY] = divisor == 0
+    if divisor:
+        state[dest] %= divisor
+    return ip + 3
+
+
+def _op_inc(state: bytearray, ip: int, sp: int) -> int:
+    addr = (state[ip + 1] + sp) % 256
+    if addr < _SPECIAL_END:
+        return _SLOW
+    res = state[addr] + 1
+    state[_CARRY] = res > 0xFF
+    state[addr] = res % 256
+    return ip + 2
+
+
+def _op_dec(state: bytearray, ip: int, sp: int) -> int:
+    addr = (state[ip + 1] + sp) % 256
+    if addr < _SPECIAL_END:
+        return _SLOW
+    res = state[addr] - 1
+    state[_CARRY] = res < 0
+    state[addr] = res % 256
+    return ip + 2
+
+
+def _op_in(state: bytearray, ip: int, sp: int) -> int:
+    dest = (state[ip + 1] + sp) % 256
+    if dest < _SPECIAL_END:
+        return _SLOW
+    state[dest] = state[_INPUT]
+    return ip + 2
+
+
+def _op_out(state: bytearray, ip: int, sp: int) -> int:
+    src = (state[ip + 1] + sp) % 256
+    if src < _SPECIAL_END:
+        return _SLOW
+    state[_OUTPUT] = state[src]
+    return ip + 2
+
+
+def _op_outc(state: bytearray, ip: int, sp: int) -> int:
+    state[_OUTPUT] = state[ip + 1]
+    return ip + 2
+
+
+def _op_unknown(state: bytearray, ip: int, sp: int) -> int:
+    # Let cycle() raise the InterpreterError.
+    return _SLOW
+
+
+_HANDLERS = [_op_unknown] * 256
+for _instr, _handler in {
+    INSTR.NOP: _op_nop,
+    INSTR.END: _op_end,
+    INSTR.SET: _op_set,
+    INSTR.MOV: _op_mov,
+    INSTR.SEND: _op_send,
+    INSTR.STACK: _op_stack,
+    INSTR.SWAP: _op_swap,
+    INSTR.MEMSET: _op_memset,
+    INSTR.MEMCPY: _op_memcpy,
+    INSTR.JMP: _op_jmp,
+    INSTR.JMPC: _op_jmpc,
+    INSTR.JZ: _op_jz,
+    INSTR.JNZ: _op_jnz,
+    INSTR.JPOS: _op_jpos,
+    INSTR.JNEG: _op_jneg,
+    INSTR.JCARRY: _op_jcarry,
+    INSTR.JNCARRY: _op_jncarry,
+    INSTR.ADD: _op_add,
+    INSTR.ADDC: _op_addc,
+    INSTR.SUB: _op_sub,
+    INSTR.SUBC: _op_subc,
+    INSTR.MUL: _op_mul,
+    INSTR.MULC: _op_mulc,
+    INSTR.DIV: _op_div,
+    INSTR.DIVC: _op_divc,
+    INSTR.MOD: _op_mod,
+    INSTR.MODC: _op_modc,
+    INSTR.INC: _op_inc,
+    INSTR.DEC: _op_dec,
+    INSTR.IN: _op_in,
+    INSTR.OUT: _op_out,
+    INSTR.OUTC: _op_outc,
+}.items():
+    _HANDLERS[_instr] = _handler
+
+
+def _stop_table(instrs) -> bytearray:
+    """
+    Returns a 256-byte table with the given opcodes flagged.
+    """
+    stops = bytearray(256)
+    for instr in instrs:
+        stops[instr] = 1
+
+    return stops
+
+
+_STOP_AT_END = _stop_table([INSTR.END])
+_STOP_NEVER = _stop_table([])
+
+
+def _run_header(state: bytearray, max_cycles: int, stops: bytearray) -> int:
+    """
+    Steps through code inside the header with cycle(), as such code reads
+    the live header bytes (the instruction pointer included). Returns the
+    number of instructions executed.
+    """
+    executed = 0
+    while (
+        state[_IP] < _SPECIAL_END
+        and executed < max_cycles
+        and not stops[state[state[_IP]]]
+    ):
+        cycle(state)
+        executed += 1
+
+    return executed
+
+
+def _run(state: bytearray, max_cycles: int, stops: bytearray) -> int:
+    handlers = _HANDLERS
+    executed = _run_header(state, max_cycles, stops)
+    ip = state[_IP]
+    sp = state[_SP]
+
+    # The clock bytes are only brought up to date when cycle() is about to
+    # run (it may read or write them) and on exit; in between, the number
+    # of cycles they are behind is executed - clock_synced.
+    clock_synced = executed
+
+    try:
+        while executed < max_cycles:
+            instr = state[ip]
+            if stops[instr]:
+                break
+
+            state[_OUTPUT] = 0x00
+            try:
+                next_ip = handlers[instr](state, ip, sp)
+            except IndexError:
+                # The instruction runs past the end of memory; let cycle()
+                # fail on it.
+                next_ip = _SLOW
+
+            if next_ip == _SLOW:
+                _advance_clock(state, executed - clock_synced)
+                clock_synced = executed
+                state[_IP] = ip
+                # cycle() owns the header until ip is reloaded; should it
+                # raise, the state is left as it left it.
+                ip = -1
+                cycle(state)
+                executed += 1
+                clock_synced = executed
+                executed += _run_header(state, max_cycles - executed, stops)
+                clock_synced = executed
+                ip = state[_IP]
+                sp = state[_SP]
+                continue
+
+            ip = next_ip
+            executed += 1
+
+    finally:
+        if ip >= 0:
+            state[_IP] = ip % 256
+        _advance_clock(state, executed - clock_synced)
+
+    return executed
+
+
+def run(
+    state: bytearray,
+    max_cycles: int,
+    until_end: bool = True,
+    profile=None,
+) -> int:
+    """
+    Executes up to <max_cycles> instructions and returns the number of
+    instructions executed. The resulting state is identical to calling
+    cycle() that many times.
+
+    If <until_end> is set, execution stops (without executing it) once
+    the instruction pointer reaches an END instruction. Otherwise END is
+    executed like any other instruction, as cycle() would.
+
+    Instructions are dispatched through a table of handlers. The
+    instruction and stack pointers are kept in locals, and the clock is
+    kept as a count of executed instructions, while running; they are
+    written back to the header on exit, or before instructions that touch
+    the header bytes are handed to cycle().
+
+    Pass a profiler.Profile as <profile> to record where the cycles go.
+    This selects a separate, instrumented loop, so the other loop pays
+    nothing for profiling support.
+    """
+    stops = _STOP_AT_END if until_end else _STOP_NEVER
+    if profile is not None:
+        return _run_profiled(state, max_cycles, stops, profile)
+
+    return _run(state, max_cycles, stops)
+
+
+def run_until(state: bytearray, max_cycles: int, instrs: list[INSTR]) -> int:
+    """
+    Like run(), but stops (without executing it) once the instruction
+    pointer reaches any of the given instructions.
+    """
+    return _run(state, max_cycles, _stop_table(instrs))
+
+
+# Profiling
+
+# Whether each conditional jump is taken, given the byte it tests (the
+# first byte memory_access() reports it reading)
+_JUMP_TAKEN = {
+    INSTR.JZ: lambda value: value == 0,
+    INSTR.JNZ: lambda value: value != 0,
+    INSTR.JPOS: lambda value: 0x01 <= value < 0x7F,
+    INSTR.JNEG: lambda value: 0x80 <= value < 0xFF,
+    INSTR.JCARRY: lambda value: value != 0,
+    INSTR.JNCARRY: lambda value: value == 0,
+}
+
+
+def _run_profiled(
+    state: bytearray, max_cycles: int, stops: bytearray, profile
+) -> int:
+    """
+    Executes instructions one at a time with cycle(), counting executions,
+    branch outcomes and memory accesses in <profile>.
+    """
+    executed = 0
+    try:
+        while executed < max_cycles:
+            ip = state[_IP]
+            instr = state[ip]
+            if stops[instr]:
+                break
+
+            reads, writes = memory_access(state)
+            # Decided before the jump, as its target may be the next address
+            taken = instr in _JUMP_TAKEN and _JUMP_TAKEN[instr](state[reads[0]])
+            cycle(state)
+            executed += 1
+
+            profile.address_counts[ip] += 1
+            profile.address_opcodes[ip] = instr
+            profile.opcode_counts[instr] += 1
+            for addr in reads:
+                profile.reads[addr] += 1
+            for addr in writes:
+                profile.writes[addr] += 1
+
+            if taken:
+                profile.taken[ip] += 1
+            elif instr in _JUMP_TAKEN:
+                profile.not_taken[ip] += 1
+
+    finally:
+        profile.cycles += executed
+
+    return executed
+
+
+# Halting detection
+
+
+class HaltStatus(Enum):
+    HALTED = "halted"
+    DIVERGES = "diverges"
+    BUDGET_EXCEEDED = "cycle budget exceeded"
+
+
+class HaltResult(NamedTuple):
+    status: HaltStatus
+    # Number of instructions executed
+    cycles: int
+    # Period of the loop the machine is stuck in, if it diverges
+    period: int = 0
+
+    def __str__(self):
+        if self.status == HaltStatus.DIVERGES:
+            return f"{self.status.value} (period {self.period})"
+
+        return self.status.value
+
+
+def _fingerprint(state: bytearray) -> bytes:
+    """
+    Returns the machine state without the clock bytes.
+    """
+    return bytes(state[: LOCATION.CLOCK_START] + state[LOCATION.CLOCK_END + 1 :])
+
+
+def _divisors(number: int) -> list[int]:
+    small = [i for i in range(1, int(number**0.5) + 1) if number % i == 0]
+    return sorted(set(small + [number // i for i in small]))
+
+
+def _loop_period(state: bytearray, multiple: int) -> int:
+    """
+    Given a state that recurs after <multiple> cycles, returns the smallest
+    number of cycles after which it recurs, which divides <multiple>.
+    """
+    start = _fingerprint(state)
+    probe = bytearray(state)
+    executed = 0
+    for divisor in _divisors(multiple):
+        executed += run(probe, divisor - executed, until_end=False)
+        if _fingerprint(probe) == start:
+            return divisor
+
+    return multiple
+
+
+def run_until_halt(
+    state: bytearray, max_cycles: int, interval: int = 64
+) -> HaltResult:
+    """
+    Runs the state until it reaches an END instruction, it is found to be
+    stuck in a loop, or <max_cycles> instructions have been executed.
+
+    Loops are detected with Brent's algorithm on fingerprints of the state
+    (everything but the clock bytes) taken every <interval> instructions:
+    the latest fingerprint is compared against a saved one, which is
+    replaced whenever the number of fingerprints since it was saved reaches
+    the next power of two. A loop is therefore found within a few times its
+    length (plus the instructions before it) while only comparing states
+    once per <interval> instructions.
+
+    Programs that read the clock bytes can be reported as diverging even
+    if they would eventually leave their loop.
+    """
+    cycles = 0
+    saved = _fingerprint(state)
+    power = distance = 1
+
+    while cycles < max_cycles:
+        step = min(interval, max_cycles - cycles)
+        executed = run(state, step)
+        cycles += executed
+        if executed < step:
+            return HaltResult(HaltStatus.HALTED, cycles)
+
+        current = _fingerprint(state)
+        if current == saved:
+            period = _loop_period(state, distance * interval)
+            return HaltResult(HaltStatus.DIVERGES, cycles, period)
+
+        if distance == power:
+            saved = current
+            power *= 2
+            distance = 0
+
+        distance += 1
+
+    if state[state[LOCATION.INSTR_PTR]] == INSTR.END:
+        return HaltResult(HaltStatus.HALTED, cycles)
+
+    return HaltResult(HaltStatus.BUDGET_EXCEEDED, cycles)
+
+
+# Basic-block compilation
+#
+# run_blocks() translates straight-line runs of instructions into Python
+# functions with their operand addresses baked in as constants. A block is
+# compiled for a specific start address and stack pointer, and ends at the
+# first jump, or before any instruction that has to be stepped on its own:
+# END, STACK, unknown opcodes and instructions touching the header bytes.
+#
+# A block function takes the state and the block cache's coverage table and
+# returns the next instruction pointer and the number of instructions it
+# executed. Before every write it checks the coverage table; if the write
+# would land on code belonging to a cached block, the function returns
+# early, leaving that instruction to be stepped and the stale blocks to be
+# dropped.
+
+_MAX_BLOCK_INSTRS = 64
+
+_CONDITIONS = {
+    INSTR.JZ: "{} == 0",
+    INSTR.JNZ: "{} != 0",
+    INSTR.JPOS: "0x01 <= {} < 0x7F",
+    INSTR.JNEG: "0x80 <= {} < 0xFF",
+}
+
+
+def _generate_block(code: bytes, start: int, sp: int) -> tuple[str, int, int]:
+    """
+    Generates the source of a block function for the instructions in
+    <code>, which holds the state's bytes from <start> onwards.
+
+    Returns the source, the number of instructions in the block and the
+    number of code bytes they occupy. If no instruction can be compiled,
+    the instruction count is 0.
+    """
+    lines = ["def block(s, c):"]
+    pos = 0
+    count = 0
+
+    def rel(offset: int) -> int:
+        return (code[pos + offset] + sp) % 256
+
+    def bail() -> str:
+        return f"return {start + pos}, {count}"
+
+    while count < _MAX_BLOCK_INSTRS and pos < len(code):
+        instr = code[pos]
+        if instr not in INSTR_OPERANDS or instr in (INSTR.END, INSTR.STACK):
+            break
+
+        size = 1 + INSTR_OPERANDS[instr]
+        if pos + size > len(code):
+            break
+
+        next_ip = start + pos + size
+        reads: list[int] = []
+        writes: list[int] = []
+        body: list[str] = []
+        terminal = False
+
+        match instr:
+            case INSTR.NOP:
+                pass
+
+            case INSTR.SET:
+                writes = [rel(1)]
+                body = [f"s[{writes[0]}] = {code[pos + 2]}"]
+
+            case INSTR.MOV:
+                writes, reads = [rel(1)], [rel(2)]
+                body = [f"s[{writes[0]}] = s[{reads[0]}]"]
+
+            case INSTR.SEND:
+                src, offset_addr = rel(1), rel(2)
+                reads = [src, offset_addr]
+                body = [
+                    f"d = ({src} + s[{offset_addr}]) % 256",
+                    f"if d < {_SPECIAL_END} or c[d]: {bail()}",
+                    f"s[d] = s[{src}]",
+                ]
+
+            case INSTR.SWAP:
+                reads = writes = [rel(1), rel(2)]
+                a, b = writes
+                body = [f"s[{a}], s[{b}] = s[{b}], s[{a}]"]
+
+            case (INSTR.MEMSET | INSTR.MEMCPY):
+                # Guarded as a whole, with a single slice of the coverage
+                dest, length = rel(1), code[pos + 3]
+                if dest < _SPECIAL_END or dest + length > 256:
+                    break
+                if instr == INSTR.MEMSET:
+                    data = f"bytes(({code[pos + 2]},)) * {length}"
+                else:
+                    src = rel(2)
+                    if src < _SPECIAL_END or src + length > 256:
+                        break
+                    data = f"s[{src}:{src + length}]"
+                body = [
+                    f"if any(c[{dest}:{dest + length}]): {bail()}",
+                    f"s[{dest}:{dest + length}] = {data}",
+                ]
+
+            case INSTR.JMP:
+                reads = [rel(1)]
+                body = [
+                    f"d = s[{reads[0]}]",
+                    f"if d < {_SPECIAL_END}: {bail()}",
+                    f"s[{_OUTPUT}] = 0",
+                    f"return d, {count + 1}",
+                ]
+                terminal = True
+
+            case INSTR.JMPC:
+                if code[pos + 1] < _SPECIAL_END:
+                    break
+                body = [f"s[{_OUTPUT}] = 0", f"return {code[pos + 1]}, {count + 1}"]
+                terminal = True
+
+            case (INSTR.JZ | INSTR.JNZ | INSTR.JPOS | INSTR.JNEG):
+                reads = [rel(1)]
+                if code[pos + 2] < _SPECIAL_END:
+                    break
+                condition = _CONDITIONS[instr].format(f"s[{reads[0]}]")
+                body = [
+                    f"s[{_OUTPUT}] = 0",
+                    f"return ({code[pos + 2]} if {condition} else {next_ip}), "
+                    f"{count + 1}",
+                ]
+                terminal = True
+
+            case (INSTR.JCARRY | INSTR.JNCARRY):
+                if code[pos + 1] < _SPECIAL_END:
+                    break
+                negate = "not " if instr == INSTR.JNCARRY else ""
+                body = [
+                    f"s[{_OUTPUT}] = 0",
+                    f"return ({code[pos + 1]} if {negate}s[{_CARRY}] "
+                    f"else {next_ip}), {count + 1}",
+                ]
+                terminal = True
+
+            case (INSTR.ADD | INSTR.SUB | INSTR.ADDC | INSTR.SUBC):
+                dest = rel(1)
+                writes = [dest]
+                if instr in (INSTR.ADD, INSTR.SUB):
+                    reads = [dest, rel(2)]
+                    value = f"s[{reads[1]}]"
+                else:
+                    reads = [dest]
+                    value = f"{code[pos + 2]}"
+
+                if instr in (INSTR.ADD, INSTR.ADDC):
+                    body = [f"r = s[{dest}] + {value}", f"s[{_CARRY}] = r > 0xFF"]
+                else:
+                    body = [f"r = s[{dest}] - {value}", f"s[{_CARRY}] = r < 0"]
+                body.append(f"s[{dest}] = r % 256")
+
+            case (INSTR.MUL | INSTR.MULC):
+                dest = rel(1)
+                writes = [dest]
+                if instr == INSTR.MUL:
+                    reads = [dest, rel(2)]
+                    value = f"s[{reads[1]}]"
+                else:
+                    reads = [dest]
+                    value = f"{code[pos + 2]}"
+                body = [f"s[{dest}] = s[{dest}] * {value} % 256"]
+
+            case (INSTR.DIV | INSTR.DIVC | INSTR.MOD | INSTR.MODC):
+                dest = rel(1)
+                writes = [dest]
+                op = "//" if instr in (INSTR.DIV, INSTR.DIVC) else "%"
+                if instr in (INSTR.DIV, INSTR.MOD):
+                    reads = [dest, rel(2)]
+                    body = [
+                        f"v = s[{reads[1]}]",
+                        f"s[{_CARRY}] = v == 0",
+                        f"if v: s[{dest}] = s[{dest}] {op} v",
+                    ]
+                elif code[pos + 2]:
+                    reads = [dest]
+                    body = [
+                        f"s[{_CARRY}] = False",
+                        f"s[{dest}] = s[{dest}] {op} {code[pos + 2]}",
+                    ]
+                else:
+                    body = [f"s[{_CARRY}] = True"]
+
+            case (INSTR.INC | INSTR.DEC):
+                addr = rel(1)
+                reads = writes = [addr]
+                if instr == INSTR.INC:
+                    body = [f"r = s[{addr}] + 1", f"s[{_CARRY}] = r > 0xFF"]
+                else:
+                    body = [f"r = s[{addr}] - 1", f"s[{_CARRY}] = r < 0"]
+                body.append(f"s[{addr}] = r % 256")
+
+            case INSTR.IN:
+                writes = [rel(1)]
+                body = [f"s[{writes[0]}] = s[{_INPUT}]"]
+
+            case INSTR.OUT:
+                reads = [rel(1)]
+                body = [f"o = s[{reads[0]}]"]
+
+            case INSTR.OUTC:
+                body = [f"o = {code[pos + 1]}"]
+
+        if any(addr < _SPECIAL_END for addr in reads + writes):
+            break
+
+        lines.append(f"    # {INSTR(instr).name} @ {start + pos}")
+        if writes:
+            guard = " or ".join(f"c[{addr}]" for addr in writes)
+            lines.append(f"    if {guard}: {bail()}")
+        lines.extend(f"    {line}" for line in body)
+
+        # Only the output of the block's last instruction survives the
+        # OUTPUT reset of the cycles that follow it.
+        output = "o" if instr in (INSTR.OUT, INSTR.OUTC) else "0"
+
+        pos += size
+        count += 1
+        if terminal:
+            return "\n".join(lines), count, pos
+
+    lines.append(f"    s[{_OUTPUT}] = {output if count else 0}")
+    lines.append(f"    return {start + pos}, {count}")
+    return "\n".join(lines), count, pos
+
+
+@functools.lru_cache(maxsize=4096)
+def _compile_block(source: str):
+    namespace = {}
+    exec(compile(source, "<lens block>", "exec"), namespace)
+    return namespace["block"]
+
+
+class _Block:
+    def __init__(self, start: int, sp: int, code: bytes, length: int, function):
+        self.start = start
+        self.sp = sp
+        self.end = start + len(code)
+        self.code = code
+        self.length = length
+        self.function = function
+
+
+class BlockCache:
+    """
+    Compiled basic blocks for run_blocks(), keyed by start address and
+    stack pointer. Each block keeps a copy of the code bytes it was
+    compiled from.
+
+    A cache can be reused between calls and between states running the
+    same program; blocks whose code no longer matches the state are
+    dropped at the start of every run_blocks() call, and while running,
+    writes into cached code drop the blocks containing it.
+    """
+
+    def __init__(self):
+        self.blocks: dict[tuple[int, int], _Block] = {}
+        # Number of cached blocks covering each address.
+        self.coverage = [0] * 256
+
+    def _add(self, block: _Block):
+        self.blocks[(block.start, block.sp)] = block
+        for addr in range(block.start, block.end):
+            self.coverage[addr] += 1
+
+    def _remove(self, key: tuple[int, int]):
+        block = self.blocks.pop(key)
+        for addr in range(block.start, block.end):
+            self.coverage[addr] -= 1
+
+    def lookup(self, state: bytearray, ip: int, sp: int) -> _Block:
+        """
+        Returns the block starting at <ip> for the given stack pointer,
+        compiling it if needed. Blocks that could not be compiled are
+        cached too, with a length of 0.
+        """
+        block = self.blocks.get((ip, sp))
+        if block is None:
+            window = bytes(state[ip:]) if ip >= _SPECIAL_END else b""
+            source, length, size = _generate_block(window, ip, sp)
+            if length:
+                block = _Block(ip, sp, window[:size], length, _compile_block(source))
+            else:
+                size = 1 + INSTR_OPERANDS.get(state[ip], 0)
+                block = _Block(ip, sp, window[:size], 0, None)
+            self._add(block)
+
+        return block
+
+    def invalidate(self, addrs: list[int]):
+        """
+        Drops every block containing one of the given addresses.
+        """
+        addrs = [addr for addr in addrs if self.coverage[addr]]
+        if not addrs:
+            return
+
+        stale = [
+            key
+            for key, block in self.blocks.items()
+            if any(block.start <= addr < block.end for addr in addrs)
+        ]
+        for key in stale:
+            self._remove(key)
+
+    def validate(self, state: bytearray):
+        """
+        Drops every block whose code no longer matches the state.
+        """
+        stale = [
+            key
+            for key, block in self.blocks.items()
+            if state[block.start : block.end] != block.code
+        ]
+        for key in stale:
+            self._remove(key)
+
+
+def run_blocks(
+    state: bytearray,
+    max_cycles: int,
+    until_end: bool = True,
+    cache: BlockCache | None = None,
+) -> int:
+    """
+    Behaves like run(), but executes compiled basic blocks instead of
+    dispatching every instruction. Pass a BlockCache to keep compiled
+    blocks between calls.
+
+    Instructions that cannot be part of a block, and blocks that would
+    exceed <max_cycles>, are stepped one instruction at a time.
+    """
+    if cache is None:
+        cache = BlockCache()
+
+    cache.validate(state)
+    blocks = cache.blocks
+    coverage = cache.coverage
+    stop = _END if until_end else -1
+    executed = 0
+    # Cycles executed by blocks but not yet added to the clock bytes, which
+    # blocks never access.
+    pending = 0
+
+    while executed < max_cycles:
+        ip = state[_IP]
+        if state[ip] == stop:
+            break
+
+        sp = state[_SP]
+        block = blocks.get((ip, sp)) or cache.lookup(state, ip, sp)
+        if block.length and executed + block.length <= max_cycles:
+            ip, count = block.function(state, coverage)
+            state[_IP] = ip
+            executed += count
+            pending += count
+            if count == block.length:
+                continue
+
+        # Step a single instruction, dropping any blocks it writes into.
+        _advance_clock(state, pending)
+        pending = 0
+        _, writes = memory_access(state)
+        run(state, 1, until_end=False)
+        cache.invalidate(writes)
+        executed += 1
+
+    _advance_clock(state, pending)
+    return executed
+
+
+# Pre-decoded instruction streams
+#
+# DecodedStream decodes the code region of a state (from the end of the
+# header up to the stack pointer) once, into one (opcode, handler, a, b,
+# next) record per address, where <a> and <b> are the raw operand bytes and
+# <next> is the address of the following instruction. run_decoded() then
+# dispatches on the records instead of re-reading the instruction bytes.
+#
+# The handlers for a stream ending at <end> return _SLOW for any write
+# below <end>, which covers the header bytes as well as the decoded code
+# itself. Such instructions are stepped on their own, after which the
+# stream is decoded again if its code has changed.
+
+# Index of the operand holding the target of each jump with a constant one
+_STATIC_TARGETS = {
+    INSTR.JMPC: 0,
+    INSTR.JZ: 1,
+    INSTR.JNZ: 1,
+    INSTR.JPOS: 1,
+    INSTR.JNEG: 1,
+    INSTR.JCARRY: 0,
+    INSTR.JNCARRY: 0,
+}
+
+
+def _dec_slow(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+    return _SLOW
+
+
+@functools.cache
+def _decoded_handlers(end: int) -> list:
+    """
+    Returns the handlers, indexed by opcode, for a stream whose code region
+    ends at <end>. Unknown opcodes have no handler.
+    """
+
+    def next_(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        # NOP, and END, whose next address is its own
+        return next_ip
+
+    def set_(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        addr = (a + sp) % 256
+        if addr < end:
+            return _SLOW
+        state[addr] = b
+        return next_ip
+
+    def mov(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        if dest < end or src < _SPECIAL_END:
+            return _SLOW
+        state[dest] = state[src]
+        return next_ip
+
+    def send(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        src = (a + sp) % 256
+        offset_addr = (b + sp) % 256
+        if src < _SPECIAL_END or offset_addr < _SPECIAL_END:
+            return _SLOW
+        dest = (src + state[offset_addr]) % 256
+        if dest < end:
+            return _SLOW
+        state[dest] = state[src]
+        return next_ip
+
+    def swap(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        addr1 = (a + sp) % 256
+        addr2 = (b + sp) % 256
+        if addr1 < end or addr2 < end:
+            return _SLOW
+        state[addr1], state[addr2] = state[addr2], state[addr1]
+        return next_ip
+
+    # The count operand of the block instructions is their last byte.
+    def memset(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        count = state[next_ip - 1]
+        if dest < end or dest + count > 256:
+            return _SLOW
+        state[dest : dest + count] = bytes((b,)) * count
+        return next_ip
+
+    def memcpy(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        count = state[next_ip - 1]
+        if (
+            dest < end
+            or src < _SPECIAL_END
+            or dest + count > 256
+            or src + count > 256
+        ):
+            return _SLOW
+        state[dest : dest + count] = state[src : src + count]
+        return next_ip
+
+    def jmp(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        addr = (a + sp) % 256
+        if addr < _SPECIAL_END or state[addr] < _SPECIAL_END:
+            return _SLOW
+        return state[addr]
+
+    # The static jump targets are checked by DecodedStream.decode().
+    def jmpc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        return a
+
+    def jz(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        condition = (a + sp) % 256
+        if condition < _SPECIAL_END:
+            return _SLOW
+        return b if state[condition] == 0 else next_ip
+
+    def jnz(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        condition = (a + sp) % 256
+        if condition < _SPECIAL_END:
+            return _SLOW
+        return b if state[condition] != 0 else next_ip
+
+    def jpos(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        condition = (a + sp) % 256
+        if condition < _SPECIAL_END:
+            return _SLOW
+        return b if 0x01 <= state[condition] < 0x7F else next_ip
+
+    def jneg(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        condition = (a + sp) % 256
+        if condition < _SPECIAL_END:
+            return _SLOW
+        return b if 0x80 <= state[condition] < 0xFF else next_ip
+
+    def jcarry(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        return a if state[_CARRY] else next_ip
+
+    def jncarry(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        return a if not state[_CARRY] else next_ip
+
+    def add(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        if dest < end or src < _SPECIAL_END:
+            return _SLOW
+        res = state[dest] + state[src]
+        state[_CARRY] = res > 0xFF
+        state[dest] = res % 256
+        return next_ip
+
+    def addc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        if dest < end:
+            return _SLOW
+        res = state[dest] + b
+        state[_CARRY] = res > 0xFF
+        state[dest] = res % 256
+        return next_ip
+
+    def sub(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        if dest < end or src < _SPECIAL_END:
+            return _SLOW
+        res = state[dest] - state[src]
+        state[_CARRY] = res < 0
+        state[dest] = res % 256
+        return next_ip
+
+    def subc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        if dest < end:
+            return _SLOW
+        res = state[dest] - b
+        state[_CARRY] = res < 0
+        state[dest] = res % 256
+        return next_ip
+
+    def mul(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        if dest < end or src < _SPECIAL_END:
+            return _SLOW
+        state[dest] = (state[dest] * state[src]) % 256
+        return next_ip
+
+    def mulc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        if dest < end:
+            return _SLOW
+        state[dest] = (state[dest] * b) % 256
+        return next_ip
+
+    def div(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        if dest < end or src < _SPECIAL_END:
+            return _SLOW
+        divisor = state[src]
+        state[_CARRY] = divisor == 0
+        if divisor:
+            state[dest] //= divisor
+        return next_ip
+
+    def divc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        if dest < end:
+            return _SLOW
+        state[_CARRY] = b == 0
+        if b:
+            state[dest] //= b
+        return next_ip
+
+    def mod(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        src = (b + sp) % 256
+        if dest < end or src < _SPECIAL_END:
+            return _SLOW
+        divisor = state[src]
+        state[_CARRY] = divisor == 0
+        if divisor:
+            state[dest] %= divisor
+        return next_ip
+
+    def modc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        if dest < end:
+            return _SLOW
+        state[_CARRY] = b == 0
+        if b:
+            state[dest] %= b
+        return next_ip
+
+    def inc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        addr = (a + sp) % 256
+        if addr < end:
+            return _SLOW
+        res = state[addr] + 1
+        state[_CARRY] = res > 0xFF
+        state[addr] = res % 256
+        return next_ip
+
+    def dec(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        addr = (a + sp) % 256
+        if addr < end:
+            return _SLOW
+        res = state[addr] - 1
+        state[_CARRY] = res < 0
+        state[addr] = res % 256
+        return next_ip
+
+    def in_(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        dest = (a + sp) % 256
+        if dest < end:
+            return _SLOW
+        state[dest] = state[_INPUT]
+        return next_ip
+
+    def out(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        src = (a + sp) % 256
+        if src < _SPECIAL_END:
+            return _SLOW
+        state[_OUTPUT] = state[src]
+        return next_ip
+
+    def outc(state: bytearray, sp: int, a: int, b: int, next_ip: int) -> int:
+        state[_OUTPUT] = a
+        return next_ip
+
+    handlers = [None] * 256
+    for instr, handler in {
+        INSTR.NOP: next_,
+        INSTR.END: next_,
+        INSTR.SET: set_,
+        INSTR.MOV: mov,
+        INSTR.SEND: send,
+        # Changes the stack pointer, which run_decoded() keeps in a local.
+        INSTR.STACK: _dec_slow,
+        INSTR.SWAP: swap,
+        INSTR.MEMSET: memset,
+        INSTR.MEMCPY: memcpy,
+        INSTR.JMP: jmp,
+        INSTR.JMPC: jmpc,
+        INSTR.JZ: jz,
+        INSTR.JNZ: jnz,
+        INSTR.JPOS: jpos,
+        INSTR.JNEG: jneg,
+        INSTR.JCARRY: jcarry,
+        INSTR.JNCARRY: jncarry,
+        INSTR.ADD: add,
+        INSTR.ADDC: addc,
+        INSTR.SUB: sub,
+        INSTR.SUBC: subc,
+        INSTR.MUL: mul,
+        INSTR.MULC: mulc,
+        INSTR.DIV: div,
+        INSTR.DIVC: divc,
+        INSTR.MOD: mod,
+        INSTR.MODC: modc,
+        INSTR.INC: inc,
+        INSTR.DEC: dec,
+        INSTR.IN: in_,
+        INSTR.OUT: out,
+        INSTR.OUTC: outc,
+    }.items():
+        handlers[instr] = handler
+
+    return handlers
+
+
+class DecodedStream:
+    """
+    The code region of a state, from the end of the header up to the stack
+    pointer, decoded for run_decoded().
+
+    Unless <strict> is unset, the region is validated as it is decoded:
+    walking it from the start, every opcode has to be known, every
+    instruction has to fit in the region, and every jump with a constant
+    target has to land on the start of one of the instructions walked (or
+    in the header, which is how functions return). An InterpreterError is
+    raised otherwise.
+    """
+
+    def __init__(self, state: bytearray, strict: bool = True):
+        self.start = int(LOCATION.HEADER_END)
+        self.end = max(state[_SP], self.start)
+        self.decode(state, strict)
+
+    def decode(self, state: bytearray, strict: bool = False):
+        """
+        (Re)decodes the region from the state. Every address holding a
+        complete instruction gets a record, so jumps into the middle of
+        an instruction still dispatch through the stream.
+        """
+        start, end = self.start, self.end
+        handlers = _decoded_handlers(end)
+        self.code = bytes(state[start:end])
+        if strict:
+            self.validate()
+
+        records = [None] * 256
+        for pos in range(start, end):
+            opcode = state[pos]
+            handler = handlers[opcode]
+            size = 1 + INSTR_OPERANDS.get(opcode, 0)
+            if handler is None or pos + size > end:
+                continue
+
+            a = state[pos + 1] if size > 1 else 0
+            b = state[pos + 2] if size > 2 else 0
+            next_ip = pos if opcode == _END else pos + size
+
+            # Jumps into the header are left to cycle().
+            if opcode in _STATIC_TARGETS:
+                if (a, b)[_STATIC_TARGETS[opcode]] < _SPECIAL_END:
+                    handler = _dec_slow
+
+            records[pos] = (opcode, handler, a, b, next_ip)
+
+        self.records = records
+
+    def validate(self):
+        """
+        Raises an InterpreterError if the decoded code is not a valid
+        instruction stream.
+        """
+        start, end = self.start, self.end
+        boundaries = set()
+        jumps = []
+        pos = start
+        while pos < end:
+            opcode = self.code[pos - start]
+            if opcode not in INSTR_OPERANDS:
+                raise InterpreterError(
+                    f"Invalid opcode 0x{opcode:02x} at address 0x{pos:02x}"
+                )
+
+            size = 1 + INSTR_OPERANDS[opcode]
+            if pos + size > end:
+                raise InterpreterError(
+                    f"{INSTR(opcode).name} at address 0x{pos:02x} runs past the "
+                    f"end of the code at 0x{end:02x}"
+                )
+
+            if opcode in _STATIC_TARGETS:
+                operand = pos + 1 + _STATIC_TARGETS[opcode]
+                jumps.append((pos, self.code[operand - start]))
+
+            boundaries.add(pos)
+            pos += size
+
+        for pos, target in jumps:
+            if target >= start and target not in boundaries:
+                raise InterpreterError(
+                    f"Jump at address 0x{pos:02x} targets 0x{target:02x}, which "
+                    f"is not the start of an instruction"
+                )
+
+    def is_stale(self, state: bytearray) -> bool:
+        return state[self.start : self.end] != self.code
+
+
+def run_decoded(
+    state: bytearray,
+    max_cycles: int,
+    until_end: bool = True,
+    stream: DecodedStream | None = None,
+) -> int:
+    """
+    Behaves like run(), but dispatches on a DecodedStream of the state's
+    code, which is decoded (and validated, raising an InterpreterError
+    before anything is executed) if not given.
+
+    Instructions outside the stream, and instructions that have to be
+    stepped on their own, are executed by cycle(); if they change the
+    decoded code, the stream is decoded again.
+    """
+    if stream is None:
+        stream = DecodedStream(state)
+
+    stops = _STOP_AT_END if until_end else _STOP_NEVER
+    records = stream.records
+    executed = _run_header(state, max_cycles, stops)
+    clock_synced = executed
+    ip = state[_IP]
+    sp = state[_SP]
+
+    try:
+        while executed < max_cycles:
+            record = records[ip]
+            if record is not None:
+                opcode, handler, a, b, next_ip = record
+                if stops[opcode]:
+                    break
+
+                state[_OUTPUT] = 0x00
+                next_ip = handler(state, sp, a, b, next_ip)
+                if next_ip != _SLOW:
+                    ip = next_ip
+                    executed += 1
+                    continue
+
+            elif stops[state[ip]]:
+                break
+
+            _advance_clock(state, executed - clock_synced)
+            clock_synced = executed
+            state[_IP] = ip
+            ip = -1
+            # cycle() itself, so that an instruction running past 0xFF fails
+            # as it would there
+            cycle(state)
+            executed += 1
+            clock_synced = executed
+            executed += _run_header(state, max_cycles - executed, stops)
+            clock_synced = executed
+            if stream.is_stale(state):
+                stream.decode(state)
+                records = stream.records
+            ip = state[_IP]
+            sp = state[_SP]
+
+    finally:
+        if ip >= 0:
+            state[_IP] = ip
+        _advance_clock(state, executed - clock_synced)
+
+    return executed
@@ -0,0 +1,197 @@
+# journal.py
+
+from pathlib import Path
+
+from assembler import LOCATION
+from exceptions import InterpreterError
+from interpreter import memory_access, run
+
+# Header bytes that change on every cycle and are therefore saved by every
+# journal entry: the instruction pointer, the clock and the output.
+_CYCLE_BYTES = (
+    LOCATION.INSTR_PTR,
+    *range(LOCATION.CLOCK_START, LOCATION.CLOCK_END + 1),
+    LOCATION.OUTPUT,
+)
+
+
+def save_snapshot(state: bytearray, path: Path | str):
+    """
+    Writes the state to <path> as a 256-byte (.lbin) image.
+    """
+    with open(path, "wb") as file:
+        file.write(state)
+
+
+def load_snapshot(path: Path | str) -> bytearray:
+    """
+    Reads a 256-byte (.lbin) image written by save_snapshot().
+    """
+    with open(path, "rb") as file:
+        state = bytearray(file.read())
+
+    if len(state) != 0x100:
+        raise InterpreterError(f"{path} is not a 256-byte image")
+
+    return state
+
+
+class Journal:
+    """
+    Steps a state forwards while recording enough to step it back again.
+
+    Every executed instruction adds an entry holding the previous values of
+    the bytes it is about to write, and every <keyframe_interval> cycles a
+    full copy of the state is kept as a keyframe. Once there are more than
+    <max_keyframes> keyframes, the oldest is evicted along with the entries
+    leading up to the next one, which bounds memory use on long runs.
+
+    run() executes many instructions at full speed instead: it only keeps a
+    keyframe where it starts, and returning to a cycle inside it replays
+    the instructions from there.
+    """
+
+    def __init__(
+        self,
+        state: bytearray,
+        keyframe_interval: int = 1024,
+        max_keyframes: int = 64,
+    ):
+        self.state = state
+        self.keyframe_interval = keyframe_interval
+        self.max_keyframes = max_keyframes
+
+        # Number of instructions executed since the journal was created
+        self.cycle = 0
+        # Earliest cycle that can still be returned to
+        self.first_cycle = 0
+        # entries[i] undoes the step from cycle first_cycle + i, or is None
+        # if the step was executed by run()
+        self.entries: list[bytes | None] = []
+        self.keyframes: dict[int, bytes] = {0: bytes(state)}
+
+    def _record(self) -> bytes:
+        """
+        Returns the journal entry for the instruction about to execute.
+        """
+        state = self.state
+        if state[LOCATION.INSTR_PTR] <= LOCATION.OUTPUT:
+            # Code inside the header is too irregular to track; keep a full
+            # copy instead.
+            return bytes(state)
+
+        _, writes = memory_access(state)
+        entry = bytearray(state[addr] for addr in _CYCLE_BYTES)
+        for addr in writes:
+            entry += bytes((addr, state[addr]))
+
+        return bytes(entry)
+
+    def _undo(self, entry: bytes):
+        state = self.state
+        if len(entry) == len(state):
+            state[:] = entry
+            return
+
+        header_len = len(_CYCLE_BYTES)
+        for index in range(len(entry) - 2, header_len - 1, -2):
+            state[entry[index]] = entry[index + 1]
+
+        for addr, value in zip(_CYCLE_BYTES, entry):
+            state[addr] = value
+
+    def _truncate(self):
+        """
+        Forgets everything recorded after the current cycle.
+        """
+        del self.entries[self.cycle - self.first_cycle :]
+        for keyframe_cycle in [c for c in self.keyframes if c > self.cycle]:
+            del self.keyframes[keyframe_cycle]
+
+    def _evict(self):
+        while len(self.keyframes) > self.max_keyframes:
+            oldest, next_oldest = list(self.keyframes)[:2]
+            del self.keyframes[oldest]
+            del self.entries[: next_oldest - self.first_cycle]
+            self.first_cycle = next_oldest
+
+    def step(self, count: int = 1) -> int:
+        """
+        Executes <count> instructions (END included, like cycle()),
+        recording each one. Returns the number executed.
+        """
+        self._truncate()
+        for _ in range(count):
+            entry = self._record()
+            run(self.state, 1, until_end=False)
+            self.entries.append(entry)
+            self.cycle += 1
+
+            if self.cycle % self.keyframe_interval == 0:
+                self.keyframes[self.cycle] = bytes(self.state)
+                self._evict()
+
+        return count
+
+    def run(self, count: int) -> int:
+        """
+        Executes up to <count> instructions (END included) with
+        interpreter.run(), recording a keyframe where they start rather
+        than an entry for each. Returns the number executed.
+        """
+        self._truncate()
+        if count <= 0:
+            return 0
+
+        if self.cycle not in self.keyframes:
+            self.keyframes[self.cycle] = bytes(self.state)
+            self._evict()
+
+        executed = run(self.state, count, until_end=False)
+        self.entries.extend([None] * executed)
+        self.cycle += executed
+        return executed
+
+    def step_back(self, count: int = 1):
+        """
+        Returns the state to where it was <count> instructions ago.
+        """
+        self.seek(self.cycle - count)
+
+    def seek(self, cycle: int):
+        """
+        Moves the state to the given cycle. Moving backwards restores the
+        nearest keyframe at or after <cycle> and undoes the entries from
+        there, or replays from the keyframe before <cycle> when it lies
+        inside a run(); moving forwards executes (and records) instructions.
+        """
+        if cycle >= self.cycle:
+            self.step(cycle - self.cycle)
+            return
+
+        if cycle < self.first_cycle:
+            raise InterpreterError(
+                f"Cannot seek to cycle {cycle}; the journal starts at cycle "
+                f"{self.first_cycle}"
+            )
+
+        later_keyframes = [c for c in self.keyframes if cycle <= c <= self.cycle]
+        if later_keyframes:
+            position = min(later_keyframes)
+            self.state[:] = self.keyframes[position]
+        else:
+            position = self.cycle
+
+        while position > cycle:
+            entry = self.entries[position - 1 - self.first_cycle]
+            if entry is None:
+                # The step was not recorded; replay up to <cycle> instead
+                start = max(c for c in self.keyframes if c <= cycle)
+                self.state[:] = self.keyframes[start]
+                run(self.state, cycle - start, until_end=False)
+                break
+
+            position -= 1
+            self._undo(entry)
+
+        self.cycle = cycle
@@ -2,10 +2,9 @@
 
 import pygame as pg
 
-from interpreter import cycle
+from journal import Journal, save_snapshot
+from build_cache import BuildCache
 
-import compiler
-import assembler
 from assembler import LOCATION
 
 from _constants import FILE_EXT
@@ -37,14 +36,17 @@ def simulate(state: bytearray, fps: int = 5, auto: int = 0):
     clock = pg.time.Clock()
     running = True
 
+    # All stepping goes through the journal so that it can be undone.
+    # Auto-stepping runs at full speed and is replayed when stepped back.
+    journal = Journal(state)
+
     while running:
         pressed = pg.key.get_pressed()
 
-        for _ in range(auto):
-            cycle(state)
+        journal.run(auto)
 
         if pressed[pg.K_SPACE]:
-            cycle(state)
+            journal.step()
 
         for event in pg.event.get():
             if event.type == pg.QUIT:
@@ -52,7 +54,17 @@ def simulate(state: bytearray, fps: int = 5, auto: int = 0):
 
             if event.type == pg.KEYDOWN:
                 if event.key == pg.K_s:
-                    cycle(state)
+                    journal.step()
+
+                # Step back one instruction
+                if event.key == pg.K_b and journal.cycle > journal.first_cycle:
+                    journal.step_back()
+
+                # Save the current state as an image
+                if event.key == pg.K_w:
+                    save_snapshot(
+                        state, f"snapshot_{journal.cycle}.{FILE_EXT.BYTECODE.value}"
+                    )
 
         screen.fill((0, 0, 0))
 
@@ -89,8 +101,12 @@ def simulate(state: bytearray, fps: int = 5, auto: int = 0):
                 (0, CHAR_SIZE[1] * 19),
             )
 
-        # Draw FPS in bottom left corner
-        draw_text(screen, f"FPS: {clock.get_fps():.2f}", (0, 720 - 32))
+        # Draw FPS and cycle count in bottom left corner
+        draw_text(
+            screen,
+            f"FPS: {clock.get_fps():.2f}  Cycle: {journal.cycle}",
+            (0, 720 - 32),
+        )
         pg.display.update()
         clock.tick(fps)
 
@@ -98,10 +114,6 @@ def simulate(state: bytearray, fps: int = 5, auto: int = 0):
 
 
 if __name__ == "__main__":
-    compilable_ext = FILE_EXT.COMPILABLE.value
-    assembly_ext = FILE_EXT.ASSEMBLY.value
-    compiler.compile(f"basic.{compilable_ext}", f"basic.{assembly_ext}")
-    with open(f"basic.{assembly_ext}", "r") as file:
-        state = assembler.masm_to_bytecode(file)
+    state = BuildCache().build(f"basic.{FILE_EXT.COMPILABLE.value}")
 
     simulate(state, fps=60, auto=0)
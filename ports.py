@@ -0,0 +1,139 @@
+# ports.py
+
+import asyncio
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+from assembler import INSTR, LOCATION
+from exceptions import InterpreterError
+from interpreter import run, run_until
+
+DEFAULT_YIELD_EVERY = 1024
+
+_STOPS = [INSTR.END, INSTR.IN, INSTR.OUT, INSTR.OUTC]
+
+
+class Machine:
+    """
+    A state with streaming I/O ports attached.
+
+    <inputs> is an iterable or async iterable bound to the INPUT port: each
+    time an IN instruction executes, the next value is written to INPUT
+    first (<default_input> once the inputs are exhausted). The values
+    written by OUT and OUTC are produced by outputs() and aoutputs().
+
+    Execution stops at END, which is left unexecuted.
+    """
+
+    def __init__(
+        self,
+        state: bytearray,
+        inputs: Iterable[int] | AsyncIterable[int] = (),
+        default_input: int = 0,
+        yield_every: int = DEFAULT_YIELD_EVERY,
+    ):
+        self.state = state
+        self.default_input = default_input
+        self.yield_every = yield_every
+
+        if isinstance(inputs, AsyncIterable):
+            self._inputs = aiter(inputs)
+            self._async_inputs = True
+        else:
+            self._inputs = iter(inputs)
+            self._async_inputs = False
+
+        # Number of instructions executed so far
+        self.cycles = 0
+
+    @property
+    def halted(self) -> bool:
+        state = self.state
+        return state[state[LOCATION.INSTR_PTR]] == INSTR.END
+
+    def _step_io(self, instr: int) -> int | None:
+        """
+        Executes the IN, OUT or OUTC instruction at the instruction pointer,
+        returning the value output by it (if any). INPUT must already hold
+        the input for an IN.
+        """
+        self.cycles += run(self.state, 1, until_end=False)
+        if instr in (INSTR.OUT, INSTR.OUTC):
+            return self.state[LOCATION.OUTPUT]
+
+        return None
+
+    def outputs(self, max_cycles: int | None = None) -> Iterator[int]:
+        """
+        Runs the machine until END or until <max_cycles> more instructions
+        have been executed (forever if None), yielding every value output.
+        """
+        if self._async_inputs:
+            raise InterpreterError("Asynchronous inputs require aoutputs()")
+
+        state = self.state
+        end = None if max_cycles is None else self.cycles + max_cycles
+        while end is None or self.cycles < end:
+            budget = self.yield_every if end is None else end - self.cycles
+            self.cycles += run_until(state, budget, _STOPS)
+            if self.cycles == end:
+                return
+
+            instr = state[state[LOCATION.INSTR_PTR]]
+            if instr == INSTR.END:
+                return
+            if instr not in _STOPS:
+                continue
+
+            if instr == INSTR.IN:
+                state[LOCATION.INPUT] = next(self._inputs, self.default_input)
+
+            value = self._step_io(instr)
+            if value is not None:
+                yield value
+
+    async def aoutputs(self, max_cycles: int | None = None) -> AsyncIterator[int]:
+        """
+        Like outputs(), but yields control to the event loop every
+        <yield_every> instructions and awaits asynchronous inputs.
+        """
+        state = self.state
+        end = None if max_cycles is None else self.cycles + max_cycles
+        since_yield = 0
+        while end is None or self.cycles < end:
+            if since_yield >= self.yield_every:
+                since_yield = 0
+                await asyncio.sleep(0)
+
+            budget = self.yield_every - since_yield
+            if end is not None:
+                budget = min(budget, end - self.cycles)
+
+            executed = run_until(state, budget, _STOPS)
+            self.cycles += executed
+            since_yield += executed
+            if self.cycles == end:
+                return
+
+            instr = state[state[LOCATION.INSTR_PTR]]
+            if instr == INSTR.END:
+                return
+            if instr not in _STOPS:
+                continue
+
+            if instr == INSTR.IN:
+                if self._async_inputs:
+                    value = await anext(self._inputs, self.default_input)
+                else:
+                    value = next(self._inputs, self.default_input)
+                state[LOCATION.INPUT] = value
+
+            value = self._step_io(instr)
+            since_yield += 1
+            if value is not None:
+                yield value
+
+    async def run(self, max_cycles: int | None = None) -> list[int]:
+        """
+        Runs the machine like aoutputs() and returns everything it output.
+        """
+        return [value async for value in self.aoutputs(max_cycles)]
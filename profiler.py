@@ -0,0 +1,116 @@
+# profiler.py
+
+import argparse
+import json
+from pathlib import Path
+
+from assembler import INSTR
+from interpreter import run
+
+
+class Profile:
+    """
+    Execution counters filled in by run(..., profile=Profile()). All
+    per-address counters are lists indexed by address.
+    """
+
+    def __init__(self):
+        self.cycles = 0
+        # Number of times the instruction at each address was executed, and
+        # the opcode last executed there
+        self.address_counts = [0] * 256
+        self.address_opcodes = [0] * 256
+        # Number of times each opcode was executed, indexed by opcode
+        self.opcode_counts = [0] * 256
+        # Outcomes of the conditional jump at each address
+        self.taken = [0] * 256
+        self.not_taken = [0] * 256
+        # Memory heat maps: number of operand reads and writes per address
+        self.reads = [0] * 256
+        self.writes = [0] * 256
+
+    def to_dict(self) -> dict:
+        """
+        Returns the non-zero counters as JSON-friendly dictionaries, with
+        addresses as hex strings and opcodes by name.
+        """
+        return {
+            "cycles": self.cycles,
+            "addresses": {
+                f"0x{addr:02x}": count
+                for addr, count in enumerate(self.address_counts)
+                if count
+            },
+            "opcodes": {
+                INSTR(opcode).name: count
+                for opcode, count in enumerate(self.opcode_counts)
+                if count
+            },
+            "branches": {
+                f"0x{addr:02x}": {"taken": taken, "not_taken": not_taken}
+                for addr, (taken, not_taken) in enumerate(
+                    zip(self.taken, self.not_taken)
+                )
+                if taken or not_taken
+            },
+            "reads": self.reads,
+            "writes": self.writes,
+        }
+
+    def to_json(self, indent: int | None = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def folded(self) -> str:
+        """
+        Returns the execution counts in the folded-stack format read by
+        flamegraph tools, one "lens;<opcode>;<address> <count>" line per
+        executed address.
+        """
+        lines = []
+        for addr, count in enumerate(self.address_counts):
+            if count:
+                name = INSTR(self.address_opcodes[addr]).name
+                lines.append(f"lens;{name};0x{addr:02x} {count}")
+
+        return "\n".join(lines)
+
+    def hottest(self, count: int = 10) -> list[tuple[int, int]]:
+        """
+        Returns the <count> most executed addresses with their counts.
+        """
+        counts = [(addr, n) for addr, n in enumerate(self.address_counts) if n]
+        return sorted(counts, key=lambda item: item[1], reverse=True)[:count]
+
+
+def profile(state: bytearray, max_cycles: int, until_end: bool = True) -> Profile:
+    """
+    Runs the state like run() and returns its profile.
+    """
+    result = Profile()
+    run(state, max_cycles, until_end, profile=result)
+    return result
+
+
+if __name__ == "__main__":
+    from fleet import build
+
+    parser = argparse.ArgumentParser(description="Profile a Lens program.")
+    parser.add_argument("program", type=Path, help=".lcom or .lasm program")
+    parser.add_argument("-c", "--max-cycles", type=int, default=1_000_000)
+    parser.add_argument("--json", type=Path, help="write the profile as JSON")
+    parser.add_argument("--folded", type=Path, help="write folded stacks")
+    args = parser.parse_args()
+
+    image = build(args.program)
+    result = profile(bytearray(image), args.max_cycles)
+
+    print(f"{result.cycles} cycles")
+    for addr, count in result.hottest():
+        name = INSTR(result.address_opcodes[addr]).name
+        print(f"  0x{addr:02x} {name:<8} {count:>10} ({count / result.cycles:.1%})")
+
+    if args.json:
+        args.json.write_text(result.to_json())
+
+    if args.folded:
+        args.folded.write_text(result.folded())
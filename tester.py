@@ -1,16 +1,79 @@
 # tester.py
 
-import compiler
-import assembler
-from assembler import INSTR, LOCATION
-from interpreter import cycle
+import argparse
+
+from assembler import LOCATION, INSTR
+from build_cache import BuildCache
+from compiler._constants import DEFAULT_OPT_LEVEL, MAX_OPT_LEVEL
+from interpreter import cycle, run_blocks, run_until_halt, HaltStatus, DecodedStream
 
 from pathlib import Path
 
+# Number of instructions a "concludes" test may execute before giving up
+MAX_CYCLES = 1_000_000
+
+# Number of instructions each engine runs a program for with --engines
+ENGINE_MAX_CYCLES = 100_000
+# Number of copies of a program run_batch() runs in lockstep
+BATCH_LANES = 4
+
+BUILD_CACHE = BuildCache()
+
+
+def _run_blocks(state: bytearray) -> list[bytes]:
+    run_blocks(state, ENGINE_MAX_CYCLES)
+    return [bytes(state)]
+
+
+def _run_batch(state: bytearray) -> list[bytes]:
+    # Imported here, so that only --engines needs NumPy
+    from batch import batch_states, run_batch
+
+    states = batch_states(state, BATCH_LANES)
+    run_batch(states, ENGINE_MAX_CYCLES)
+    return [bytes(lane) for lane in states]
+
+
+# Engines that --engines checks against cycle(). Each runs copies of a
+# state until they reach an END instruction or have executed
+# ENGINE_MAX_CYCLES instructions, and returns the final states.
+ENGINES = {
+    "run_blocks": _run_blocks,
+    "run_batch": _run_batch,
+}
+
+
+def _cycle_until_end(state: bytearray):
+    for _ in range(ENGINE_MAX_CYCLES):
+        if state[state[LOCATION.INSTR_PTR]] == INSTR.END:
+            break
+        cycle(state)
 
-def run_test_file(test_path: Path):
+
+def mismatched_engines(state: bytearray) -> list[str]:
+    """
+    Runs copies of <state> with cycle() and with each of the ENGINES,
+    returning the names of the engines whose final state differs.
     """
-    Runs the test file at the given path.
+    expected = bytearray(state)
+    _cycle_until_end(expected)
+
+    mismatched: list[str] = []
+    for name, engine in ENGINES.items():
+        if any(final != expected for final in engine(bytearray(state))):
+            mismatched.append(name)
+
+    return mismatched
+
+
+def run_test_file(
+    test_path: Path, opt_level: int = DEFAULT_OPT_LEVEL, check_engines: bool = False
+):
+    """
+    Runs the test file at the given path, compiling its tests at
+    <opt_level>. If <check_engines> is set, every program that is run is
+    also run on each of the ENGINES, which have to leave the same state
+    as cycle().
 
     A test file has the extension .ltest. Tests are separated by
     header lines with the following format:
@@ -19,10 +82,10 @@ def run_test_file(test_path: Path):
     >>> <test_name> concludes <expected_output>
     >>> <test_name> fails
 
-    Each test is run as a separate file.
+    Each test is compiled and run separately, in memory.
     """
 
-    print(f"\nRunning test file {test_path}")
+    print(f"\nRunning test file {test_path} (-O{opt_level})")
 
     # Get the full text of the test file
     with open(test_path, "r") as file:
@@ -43,31 +106,35 @@ def run_test_file(test_path: Path):
         title = f"{header[0]:<40}"
         expectation = header[1]
 
-        # Write the test code to "_test.lcom"
-        with open("_test.lcom", "w") as lcom:
-            lcom.write(code)
-
         if expectation in ("outputs", "concludes"):
             expected_output = [int(i) for i in header[2:]]
 
             try:
-                compiler.compile("_test.lcom", "_test.lasm")
-                with open("_test.lasm", "r") as lasm:
-                    state = assembler.masm_to_bytecode(lasm)
+                state = BUILD_CACHE.build_source(code, opt_level=opt_level)
+                # Fail fast on bytecode that could never run correctly
+                DecodedStream(state)
 
             except Exception as e:
                 print(f"  {title} - Failed")
                 print(f"  {e}")
                 continue
 
+            if check_engines and (mismatched := mismatched_engines(state)):
+                print(f"  {title} - Failed")
+                print(f"    State differs from cycle() on: {', '.join(mismatched)}")
+                continue
+
             if expectation == "outputs":
                 output: list[int] = []
                 for _ in range(len(expected_output)):
                     output.append(cycle(state))
 
             elif expectation == "concludes":
-                while state[state[LOCATION.INSTR_PTR]] != INSTR.END:
-                    cycle(state)
+                result = run_until_halt(state, MAX_CYCLES)
+                if result.status != HaltStatus.HALTED:
+                    print(f"  {title} - Failed")
+                    print(f"    Program {result} after {result.cycles} cycles")
+                    continue
 
                 stack_ptr = state[LOCATION.STACK_PTR]
                 output = state[stack_ptr : stack_ptr + len(expected_output)]
@@ -82,9 +149,9 @@ def run_test_file(test_path: Path):
 
         elif expectation == "fails":
             try:
-                compiler.compile("_test.lcom", "_test.lasm")
-                with open("_test.lasm", "r") as lasm:
-                    state = assembler.masm_to_bytecode(lasm)
+                state = BUILD_CACHE.build_source(code, opt_level=opt_level)
+                # Fail fast on bytecode that could never run correctly
+                DecodedStream(state)
 
             except Exception as e:
                 print(f"  {title} - Passed (Successfully raised exception)")
@@ -99,6 +166,24 @@ def run_test_file(test_path: Path):
 
 
 if __name__ == "__main__":
-    test_dir = Path("tests/")
-    for path in test_dir.glob("*.ltest"):
-        run_test_file(path)
+    parser = argparse.ArgumentParser(description="Run the Lens test files.")
+    parser.add_argument(
+        "paths", nargs="*", type=Path, help=".ltest files (default: tests/*.ltest)"
+    )
+    parser.add_argument(
+        "-O",
+        "--opt-level",
+        type=int,
+        choices=range(MAX_OPT_LEVEL + 1),
+        default=DEFAULT_OPT_LEVEL,
+    )
+    parser.add_argument(
+        "--engines",
+        action="store_true",
+        help="also run every program on " + ", ".join(ENGINES) + " and compare "
+        "the final state with cycle()'s",
+    )
+    args = parser.parse_args()
+
+    for path in args.paths or Path("tests/").glob("*.ltest"):
+        run_test_file(path, args.opt_level, args.engines)